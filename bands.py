@@ -0,0 +1,216 @@
+"""
+Band areas, heights and centroids over a whole series.
+
+`BandIntegrator` finds the rows of every band on the wave number axis once
+(windowing.WindowSelector, exclusive bounds like columns_selection). Areas
+and first moments are linear in the intensities, so the trapezoid weights
+of all bands are put once in two (n_bands, n_rows) matrices and a chunk of
+spectra is measured with one matrix product each (on the spectra as rows,
+which is how a store or a DataFrame lays them out in memory):
+
+    area      trapezoidal integral over the band
+    centroid  integral of x * y over the integral of y, NaN when that
+              falls outside the band (no real band, area close to 0)
+    height    largest value in the band, one `maximum.reduceat` over the
+              rows of all bands laid end to end
+
+The cost hardly depends on the number of bands, only on the points they
+cover.
+
+With baseline="linear" a straight line through the first and last point
+of each band is subtracted first (the usual two-point baseline of band
+integration). For areas and centroids it is folded into the weights.
+
+    table = band_table(referenced, {"CO": (2000, 2100), "C=O": (1650, 1800)}, baseline="linear")
+    table["area"]            # spectra x bands
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+from windowing import WindowSelector, column_times
+
+MEASURES = ("area", "height", "centroid")
+BASELINES = (None, "linear")
+
+
+def _band_label(band):
+    low, high = sorted(band)
+    return f"{low:g}-{high:g}"
+
+
+class BandIntegrator:
+    """
+    Parameters
+    ----------
+    x : array-like, shape (n_points,)
+        Wave number axis, in any order.
+    bands : dict[str, tuple[float, float]] | list[tuple[float, float]]
+        Bands by name, or a list of (low, high) named "low-high".
+    baseline : None | "linear"
+        Per-band baseline subtracted before measuring.
+
+    Attributes
+    ----------
+    names : list[str]
+        Band names, in order.
+    rows : slice
+        Rows of the axis from the first to the last band; only these are read.
+    """
+
+    def __init__(self, x, bands, baseline=None):
+        if baseline not in BASELINES:
+            raise ValueError(f"baseline must be one of {BASELINES}, not {baseline!r}")
+        if not isinstance(bands, dict):
+            bands = {_band_label(band): band for band in bands}
+        if not bands:
+            raise ValueError("No bands given")
+        self.x = np.asarray(x, dtype=np.float64)
+        self.names = list(bands)
+        self.baseline = baseline
+
+        selector = WindowSelector((self.x, np.empty((self.x.size, 0))))
+        all_rows = np.arange(self.x.size)
+        rows = []
+        for name, band in bands.items():
+            band_rows = all_rows[selector.rows(tuple(sorted(band)))]
+            if band_rows.size == 0:
+                raise ValueError(f"Band '{name}' {tuple(band)} has no points on the axis")
+            rows.append(band_rows[np.argsort(self.x[band_rows], kind="stable")])
+        first_row = min(band_rows.min() for band_rows in rows)
+        self.rows = slice(int(first_row), int(max(band_rows.max() for band_rows in rows)) + 1)
+        n_rows = self.rows.stop - first_row
+
+        # area = weights @ y and moment = moments @ y, on self.rows; moments
+        # are taken about the band centre, which keeps the baseline
+        # subtraction from cancelling large terms
+        self._weights = np.zeros((len(rows), n_rows))
+        self._moments = np.zeros((len(rows), n_rows))
+        self._centres = np.array([self.x[band_rows[[0, -1]]].mean() for band_rows in rows])
+        self._half_spans = np.array([np.ptp(self.x[band_rows]) / 2 for band_rows in rows])
+        for band, band_rows in enumerate(rows):
+            positions = band_rows - first_row
+            band_x = self.x[band_rows] - self._centres[band]
+            dx = np.diff(band_x)
+            weight = np.zeros(band_x.size)
+            weight[:-1] += dx / 2
+            weight[1:] += dx / 2
+            self._weights[band, positions] = weight
+            self._moments[band, positions] = weight * band_x
+            if baseline == "linear":
+                # the line is first * (1 - f) + last * f along the band
+                span = band_x[-1] - band_x[0]
+                fraction = (band_x - band_x[0]) / span if span > 0 else np.zeros(band_x.size)
+                for position, share in ((positions[0], 1 - fraction), (positions[-1], fraction)):
+                    self._weights[band, position] -= np.sum(weight * share)
+                    self._moments[band, position] -= np.sum(weight * band_x * share)
+
+        # heights: rows of all bands end to end, as positions in self.rows
+        self._widths = np.array([band_rows.size for band_rows in rows])
+        self._band_rows = np.concatenate(rows) - first_row
+        self._offsets = np.concatenate([[0], np.cumsum(self._widths)[:-1]])
+        self._ends = self._offsets + self._widths - 1
+        band_x = self.x[self._band_rows + first_row]
+        start = np.repeat(band_x[self._offsets], self._widths)
+        span = np.repeat(band_x[self._ends], self._widths) - start
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self._fraction = np.where(span > 0, (band_x - start) / span, 0.0)
+
+    def __len__(self):
+        return len(self.names)
+
+    def measure(self, Y, measures=MEASURES, chunk_size=2048):
+        """
+        Measure every band of every column of Y.
+
+        Parameters
+        ----------
+        Y : array-like, shape (n_points,) or (n_points, n_spectra)
+        measures : tuple[str]
+            Any of "area", "height", "centroid".
+        chunk_size : int
+            Spectra read at a time, bounds the temporary memory to
+            chunk_size x (points in all bands).
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            One (n_spectra, n_bands) array per measure.
+        """
+        unknown = set(measures) - set(MEASURES)
+        if unknown:
+            raise ValueError(f"Unknown measures {sorted(unknown)}. Use any of: {', '.join(MEASURES)}.")
+        Y = np.asarray(Y)
+        if Y.ndim == 1:
+            Y = Y[:, None]
+        if Y.shape[0] != self.x.size:
+            raise ValueError(f"Y has {Y.shape[0]} points, the x axis has {self.x.size}")
+
+        n_spectra = Y.shape[1]
+        results = {name: np.empty((n_spectra, len(self))) for name in measures}
+        # one spectrum per row; for column-major data (stores, DataFrames)
+        # this is a view and the reductions below run along contiguous memory
+        spectra = Y.T
+        for start in range(0, n_spectra, chunk_size):
+            stop = min(start + chunk_size, n_spectra)
+            block = np.asarray(spectra[start:stop, self.rows], dtype=np.float64)
+            for name, values in self._measure_block(block, measures).items():
+                results[name][start:stop] = values
+        return results
+
+    def _measure_block(self, block, measures):
+        out = {}
+        if "area" in measures or "centroid" in measures:
+            area = block @ self._weights.T
+            if "area" in measures:
+                out["area"] = area
+            if "centroid" in measures:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    offset = (block @ self._moments.T) / area
+                offset[~(np.abs(offset) <= self._half_spans)] = np.nan
+                out["centroid"] = offset + self._centres
+        if "height" in measures:
+            values = np.take(block, self._band_rows, axis=1)
+            if self.baseline == "linear":
+                first = values[:, self._offsets]
+                slope = values[:, self._ends] - first
+                values -= np.repeat(first, self._widths, axis=1)
+                line = np.repeat(slope, self._widths, axis=1)
+                line *= self._fraction
+                values -= line
+            out["height"] = np.maximum.reduceat(values, self._offsets, axis=1)
+        return out
+
+
+@instrumented
+def band_table(data, bands, baseline=None, measures=MEASURES, interval=None, chunk_size=2048):
+    """
+    Time x band table of a series.
+
+    Parameters
+    ----------
+    data : pd.DataFrame | SeriesStore | tuple[np.ndarray, np.ndarray]
+        The series, as accepted by windowing.WindowSelector.
+    bands, baseline
+        See BandIntegrator.
+    measures : tuple[str]
+        Any of "area", "height", "centroid".
+    interval : float | None
+        Minutes between spectra; the index becomes the time of every
+        spectrum (like the plot labels) instead of its name.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per spectrum, columns (measure, band).
+    """
+    selector = WindowSelector(data)
+    integrator = BandIntegrator(selector.x, bands, baseline)
+    results = integrator.measure(selector.intensities, measures, chunk_size)
+
+    index = pd.Index(selector.columns, name="spectrum")
+    if interval is not None:
+        index = pd.Index(column_times(selector.columns, interval), name="time (min)")
+    columns = pd.MultiIndex.from_product([list(measures), integrator.names], names=["measure", "band"])
+    values = np.concatenate([results[name] for name in measures], axis=1)
+    return pd.DataFrame(values, index=index, columns=columns)
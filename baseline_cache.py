@@ -0,0 +1,164 @@
+"""
+On-disk cache for baseline fits.
+
+Every entry is one .npz file named after a hash of the fitter name, its
+parameters, x and y, so the same spectrum fitted the same way is found
+again in a later session and the fit is skipped. The folder is kept under
+`max_bytes` by removing the least recently used entries; a hit refreshes
+the entry's modification time, which is what the LRU order is based on.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from baselines import float_dtype
+
+# Part of every key, bump it when a fitter implementation changes results
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = ".baseline_cache"
+
+
+class BaselineCache:
+    """
+    Parameters
+    ----------
+    path : str
+        Cache folder, created if needed.
+    max_bytes : int
+        Size limit of the folder, default 512 MB.
+
+    Attributes
+    ----------
+    hits, misses, evictions : int
+        Counters since the cache object was created, see `stats()`.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=512 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(path, exist_ok=True)
+        # key -> [size, last use]; rebuilt from the folder at start
+        self._entries = {}
+        for file in os.listdir(path):
+            if file.endswith(".npz"):
+                stat = os.stat(os.path.join(path, file))
+                self._entries[file[:-4]] = [stat.st_size, stat.st_mtime]
+        self._size = sum(size for size, _ in self._entries.values())
+
+    def __repr__(self):
+        return f"BaselineCache({self.path!r}, {len(self._entries)} entries, {self._size / 2**20:.1f} MB)"
+
+    @staticmethod
+    def key(fitter, params, x, y, kind="baseline"):
+        digest = hashlib.blake2b(digest_size=20)
+        header = {"version": CACHE_VERSION, "kind": kind, "fitter": fitter, "params": params}
+        digest.update(json.dumps(header, sort_keys=True, default=str).encode())
+        digest.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def get(self, key):
+        """Return the arrays stored under `key` as a dict, or None."""
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        try:
+            with np.load(self._file(key)) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            # removed or damaged behind our back, forget it
+            self._forget(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        os.utime(self._file(key))
+        self._entries[key][1] = os.stat(self._file(key)).st_mtime
+        return arrays
+
+    def put(self, key, **arrays):
+        file = self._file(key)
+        tmp_file = file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file, file)
+        if key in self._entries:
+            self._size -= self._entries[key][0]
+        stat = os.stat(file)
+        self._entries[key] = [stat.st_size, stat.st_mtime]
+        self._size += stat.st_size
+        self._evict()
+
+    def _forget(self, key):
+        size, _ = self._entries.pop(key)
+        self._size -= size
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if self._size <= self.max_bytes:
+                break
+            self._forget(key)
+            self.evictions += 1
+
+    def clear(self):
+        for key in list(self._entries):
+            self._forget(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._size,
+        }
+
+    def fit_columns(self, fitter, params, x, Y, fit):
+        """
+        Baselines of every column of `Y`, fitting only the columns not cached.
+
+        `fit(Y_missing)` must return (baselines, corrected, info) like
+        BatchBaseline.fit. Returns the baseline matrix and the info table.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        Y = np.asarray(Y)
+        baselines = np.empty(Y.shape, dtype=float_dtype(Y.dtype), order="F")
+        rows = [None] * Y.shape[1]
+        keys = [self.key(fitter, params, x, Y[:, col], kind="batch") for col in range(Y.shape[1])]
+
+        missing = []
+        for col, key in enumerate(keys):
+            entry = self.get(key)
+            if entry is None:
+                missing.append(col)
+                continue
+            baselines[:, col] = entry["baseline"]
+            rows[col] = {"iterations": int(entry["iterations"]), "tol": float(entry["tol"]),
+                         "converged": bool(entry["converged"])}
+
+        if missing:
+            fitted, _, info = fit(Y[:, missing])
+            for idx, col in enumerate(missing):
+                baselines[:, col] = fitted[:, idx]
+                row = info.iloc[idx]
+                rows[col] = {"iterations": int(row["iterations"]), "tol": float(row["tol"]),
+                             "converged": bool(row["converged"])}
+                self.put(keys[col], baseline=fitted[:, idx], **rows[col])
+
+        return baselines, pd.DataFrame(rows)
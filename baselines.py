@@ -0,0 +1,350 @@
+"""
+Batched baseline fitting for many spectra that share one wave number axis.
+
+`bkg_fitting` builds a new pybaselines fitter for every spectrum, which
+redoes all the work that only depends on x. `BatchBaseline` does that setup
+once per axis:
+
+    asls      the banded penalty lam * D'D is built once, every iteration
+              only adds the weights to its main diagonal before solving
+    modpoly   the Vandermonde matrix and its pseudo-inverse are built once
+    mor/snip  one pybaselines.Baseline object is reused for every column
+
+The asls and modpoly loops follow pybaselines (same weighting, stopping
+criterion and defaults), results agree with `bkg_fitting` to rounding.
+
+`fit_baselines_parallel` spreads column chunks over a process pool. The
+x axis and the intensities live in one shared memory block (laid out like
+a series store, column 0 is x) and the workers write their baselines into
+a second one, so no DataFrame or matrix is pickled (shared_arrays.py).
+
+float32 intensities stay float32: every column is fitted in float64 on its
+own and the baselines are written back in the input precision, so a compact
+series is never converted as a whole. `compare_dtype` measures what that
+costs against a float64 run.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pybaselines import Baseline
+from pybaselines.utils import difference_matrix
+from scipy.linalg import solveh_banded
+
+from instrumentation import instrumented
+from shared_arrays import attach_matrix, shared_matrix, shared_series
+
+# Parameters used for every fitter unless overridden by keyword arguments
+FITTER_PARAMS = {
+    "modpoly": {"poly_order": 5},
+    "asls": {"lam": 1e7, "p": 0.02},
+    "mor": {"half_window": 30},
+    "snip": {"max_half_window": 40, "decreasing": True, "smooth_half_window": 3},
+}
+
+# pybaselines defaults for the loops implemented here
+ASLS_DEFAULTS = {"diff_order": 2, "max_iter": 50, "tol": 1e-3}
+MODPOLY_DEFAULTS = {"max_iter": 250, "tol": 1e-3}
+
+_MIN_FLOAT = np.finfo(float).eps
+
+# Largest relative deviation (norm of the difference over norm of the
+# baseline, per spectrum) accepted between float32 and float64 baselines
+COMPACT_TOLERANCE = 1e-4
+
+
+def fitter_params(fitter, **params):
+    if fitter not in FITTER_PARAMS:
+        raise ValueError(f"Unknown fitter '{fitter}'. Use one of: {', '.join(FITTER_PARAMS)}.")
+    return {**FITTER_PARAMS[fitter], **params}
+
+
+def float_dtype(dtype):
+    """float32 (or narrower) stays float32, anything else is computed as float64."""
+    return np.dtype(np.float32 if np.dtype(dtype) in (np.float16, np.float32) else np.float64)
+
+
+def check_finite(Y, names=None):
+    """
+    Raise ValueError if a column of Y (n_points, n_spectra) holds NaN or inf.
+
+    The solvers run without their own finite checks, a single NaN (e.g. a
+    spectrum interpolated onto a wider axis) would silently turn the whole
+    baseline into NaN.
+    """
+    bad = np.flatnonzero(~np.isfinite(Y).all(axis=0))
+    if bad.size:
+        labels = [str(names[col]) if names is not None else str(col) for col in bad[:5]]
+        more = f" and {bad.size - 5} more" if bad.size > 5 else ""
+        raise ValueError(f"NaN or inf in {bad.size} spectra ({', '.join(labels)}{more}); "
+                         "load them with grid='intersection' or select a window they all cover")
+
+
+def _relative_difference(old, new, axis=None):
+    return np.linalg.norm(new - old, axis=axis) / np.maximum(np.linalg.norm(old, axis=axis), _MIN_FLOAT)
+
+
+class BatchBaseline:
+    """
+    Fit the same baseline method to every column of an intensity matrix.
+
+    Parameters
+    ----------
+    x : array-like, shape (n_points,)
+        Wave number axis shared by all spectra.
+    fitter : str
+        One of "modpoly", "asls", "mor", "snip".
+    **params
+        Overrides for FITTER_PARAMS[fitter] (lam, p, poly_order, tol, ...).
+    """
+
+    def __init__(self, x, fitter, **params):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.fitter = fitter
+        self.params = fitter_params(fitter, **params)
+
+        if fitter == "asls":
+            self.params = {**ASLS_DEFAULTS, **self.params}
+            if not 0 < self.params["p"] < 1:
+                raise ValueError('p must be between 0 and 1')
+            # lower banded form of lam * D'D for scipy's solveh_banded
+            D = difference_matrix(self.x.size, self.params["diff_order"])
+            penalty = (self.params["lam"] * (D.T @ D)).todia()
+            n_bands = self.params["diff_order"] + 1
+            self._penalty = np.zeros((n_bands, self.x.size))
+            for k in range(n_bands):
+                diagonal = penalty.diagonal(-k)
+                self._penalty[k, :diagonal.size] = diagonal
+        elif fitter == "modpoly":
+            self.params = {**MODPOLY_DEFAULTS, **self.params}
+            mapped_x = np.polynomial.polyutils.mapdomain(
+                self.x, np.array([self.x.min(), self.x.max()]), np.array([-1., 1.]))
+            self._vandermonde = np.polynomial.polynomial.polyvander(mapped_x, self.params["poly_order"])
+            self._pseudo_inverse = np.linalg.pinv(self._vandermonde)
+        else:
+            self._baseline_fitter = Baseline(x_data=self.x)
+
+    @instrumented(name="BatchBaseline.fit", fitter=lambda arguments: arguments["self"].fitter)
+    def fit(self, Y, warm_start=False):
+        """
+        Fit every column of `Y`.
+
+        Parameters
+        ----------
+        Y : array-like, shape (n_points,) or (n_points, n_spectra)
+        warm_start : bool
+            Treat the columns as an ordered time series and start every asls
+            fit from the previous column's baseline (its first weights are
+            taken against it). Neighbouring spectra of a kinetic run differ
+            little, so far fewer iterations are needed. modpoly stops too
+            early on its slow convergence for a seeded fit to land within
+            `tol` of the cold one, it fits every column cold; mor and snip
+            are not iterative. Both ignore it.
+
+        Returns
+        -------
+        baselines : np.ndarray, same shape as Y, float32 for float32 input
+        corrected : np.ndarray, Y - baselines
+        info : pd.DataFrame
+            One row per column: 'iterations', 'tol' (last relative change)
+            and 'converged'. Non-iterative fitters report 1 iteration.
+        """
+        Y = np.asarray(Y)
+        Y = Y.astype(float_dtype(Y.dtype), copy=False)
+        single = Y.ndim == 1
+        if single:
+            Y = Y[:, None]
+        if Y.shape[0] != self.x.size:
+            raise ValueError(f"Y has {Y.shape[0]} points, the x axis has {self.x.size}")
+        check_finite(Y)
+
+        baselines = np.empty_like(Y, order="F")
+        if self.fitter == "asls":
+            iterations, tol = self._fit_asls(Y, baselines, warm_start)
+        elif self.fitter == "modpoly":
+            iterations, tol = self._fit_modpoly(Y, baselines)
+        else:
+            method = getattr(self._baseline_fitter, self.fitter)
+            for col in range(Y.shape[1]):
+                baselines[:, col] = method(np.asarray(Y[:, col], dtype=np.float64), **self.params)[0]
+            iterations = np.ones(Y.shape[1], dtype=int)
+            tol = np.full(Y.shape[1], np.nan)
+
+        converged = np.ones(Y.shape[1], dtype=bool)
+        if "tol" in self.params:
+            converged = tol < self.params["tol"]
+        info = pd.DataFrame({"iterations": iterations, "tol": tol, "converged": converged})
+
+        corrected = Y - baselines
+        if single:
+            return baselines[:, 0], corrected[:, 0], info
+        return baselines, corrected, info
+
+    def _solve_asls(self, y, weights, lhs):
+        np.copyto(lhs, self._penalty)
+        lhs[0] += weights
+        return solveh_banded(lhs, weights * y, overwrite_ab=True, overwrite_b=True,
+                             lower=True, check_finite=False)
+
+    def _fit_asls(self, Y, baselines, warm_start=False):
+        p, max_iter, tol = self.params["p"], self.params["max_iter"], self.params["tol"]
+        n_spectra = Y.shape[1]
+        iterations = np.empty(n_spectra, dtype=int)
+        final_tol = np.empty(n_spectra)
+        lhs = np.empty_like(self._penalty)
+        baseline = None
+        for col in range(n_spectra):
+            y = np.asarray(Y[:, col], dtype=np.float64)
+            if warm_start and baseline is not None:
+                # Weights of this spectrum against the previous baseline; the
+                # previous weights themselves are no seed, noise flips them
+                weight_array = np.where(y > baseline, p, 1 - p)
+            else:
+                weight_array = np.ones_like(y)
+            for i in range(max_iter + 1):
+                baseline = self._solve_asls(y, weight_array, lhs)
+                new_weights = np.where(y > baseline, p, 1 - p)
+                calc_difference = _relative_difference(weight_array, new_weights)
+                if calc_difference < tol:
+                    break
+                weight_array = new_weights
+            baselines[:, col] = baseline
+            iterations[col] = i + 1
+            final_tol[col] = calc_difference
+        return iterations, final_tol
+
+    def _fit_modpoly(self, Y, baselines):
+        max_iter, tol = self.params["max_iter"], self.params["tol"]
+        n_spectra = Y.shape[1]
+        iterations = np.empty(n_spectra, dtype=int)
+        final_tol = np.empty(n_spectra)
+        # Column by column on purpose: a matrix product over many columns
+        # rounds differently depending on which columns are in it, fitting
+        # each one alone keeps results independent of batching and chunking
+        for col in range(n_spectra):
+            y = np.asarray(Y[:, col], dtype=np.float64)
+            baseline = self._vandermonde @ (self._pseudo_inverse @ y)
+            for i in range(max_iter):
+                baseline_old = baseline
+                y = np.minimum(y, baseline)
+                baseline = self._vandermonde @ (self._pseudo_inverse @ y)
+                calc_difference = _relative_difference(baseline_old, baseline)
+                if calc_difference < tol:
+                    break
+            baselines[:, col] = baseline
+            iterations[col] = i + 1
+            final_tol[col] = calc_difference
+        return iterations, final_tol
+
+
+def fit_baselines(fitter, x, Y, warm_start=False, **params):
+    """Shortcut for BatchBaseline(x, fitter, **params).fit(Y, warm_start)."""
+    return BatchBaseline(x, fitter, **params).fit(Y, warm_start=warm_start)
+
+
+def compare_warm_start(fitter, x, Y, **params):
+    """
+    Fit an ordered series cold and warm-started and compare both.
+
+    Returns a dict with the total iterations of both runs, the iterations
+    saved, and the largest difference between a warm and a cold baseline,
+    as absolute value and as relative norm (the measure the `tol` stopping
+    criterion uses, so it compares directly with `tol`).
+    """
+    fitter = BatchBaseline(x, fitter, **params)
+    cold, _, cold_info = fitter.fit(Y)
+    warm, _, warm_info = fitter.fit(Y, warm_start=True)
+    return {
+        "cold_iterations": int(cold_info["iterations"].sum()),
+        "warm_iterations": int(warm_info["iterations"].sum()),
+        "iterations_saved": int(cold_info["iterations"].sum() - warm_info["iterations"].sum()),
+        "max_deviation": float(np.abs(warm - cold).max()),
+        "max_relative_deviation": float(_relative_difference(cold, warm, axis=0).max()),
+    }
+
+
+def compare_dtype(fitter, x, Y, dtype=np.float32, **params):
+    """
+    Fit Y in float64 and in `dtype` and compare the baselines.
+
+    Returns the largest absolute and relative deviation (the relative one
+    is per spectrum, like compare_warm_start) and whether it stays within
+    COMPACT_TOLERANCE.
+    """
+    fitter = BatchBaseline(x, fitter, **params)
+    Y = np.asarray(Y)
+    reference, _, _ = fitter.fit(Y.astype(np.float64))
+    compact, _, _ = fitter.fit(Y.astype(dtype))
+    relative = float(_relative_difference(reference, compact.astype(np.float64), axis=0).max())
+    return {
+        "dtype": np.dtype(dtype).name,
+        "max_deviation": float(np.abs(compact - reference).max()),
+        "max_relative_deviation": relative,
+        "within_tolerance": relative <= COMPACT_TOLERANCE,
+    }
+
+
+# State of a pool worker, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(data_name, out_name, shape, fitter, params):
+    data_shm, data = attach_matrix(data_name, shape)
+    out_shm, out = attach_matrix(out_name, (shape[0], shape[1] - 1))
+    _worker.update(
+        shm=(data_shm, out_shm), data=data, out=out,
+        # the fitter setup is done once per worker, not once per chunk
+        fitter=BatchBaseline(data[:, 0], fitter, **params),
+    )
+
+
+def _fit_chunk(start, stop):
+    Y = _worker["data"][:, 1 + start:1 + stop]
+    baselines, _, info = _worker["fitter"].fit(Y)
+    _worker["out"][:, start:stop] = baselines
+    return start, info
+
+
+@instrumented(fitter=lambda arguments: arguments["fitter"])
+def fit_baselines_parallel(fitter, x, Y, workers=None, chunk_size=None, **params):
+    """
+    Same as `fit_baselines` with column chunks fitted in a process pool.
+
+    Every column is fitted by the same code as the serial path, results are
+    put back in the original column order.
+
+    Parameters
+    ----------
+    workers : int | None
+        Number of processes, defaults to os.cpu_count().
+    chunk_size : int | None
+        Columns per task, defaults to about four tasks per worker.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    Y = np.asarray(Y)
+    Y = Y.astype(float_dtype(Y.dtype), copy=False)
+    if Y.ndim != 2 or Y.shape[0] != x.size:
+        raise ValueError(f"Y must have shape ({x.size}, n_spectra), got {Y.shape}")
+    # validate the fitter, parameters and data before starting any process
+    params = fitter_params(fitter, **params)
+    check_finite(Y)
+    n_points, n_spectra = Y.shape
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, -(-n_spectra // (4 * workers)))
+
+    chunks = [(start, min(start + chunk_size, n_spectra)) for start in range(0, n_spectra, chunk_size)]
+    infos = {}
+    with shared_series(x, Y) as (data_name, shape), shared_matrix((n_points, n_spectra)) as (out_name, out):
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(data_name, out_name, shape, fitter, params)) as executor:
+            futures = [executor.submit(_fit_chunk, start, stop) for start, stop in chunks]
+            for future in futures:
+                start, info = future.result()
+                infos[start] = info
+        baselines = out.astype(Y.dtype, order="F")
+        del out
+
+    info = pd.concat([infos[start] for start, _ in chunks], ignore_index=True)
+    return baselines, Y - baselines, info
@@ -0,0 +1,285 @@
+"""
+Process many experiment folders at once.
+
+    python batch_processing.py "experiments/2024-*" other/experiment --window 1000 1800 --fitter asls --plot
+
+Every folder goes through the same stages in a process pool, one folder
+per task:
+
+    combine     read the spectra (in `raw/` if the folder has one)
+    reference   subtract the first spectrum
+    window      keep wave_range[0] < x < wave_range[1]    (--window)
+    baseline    subtract a baseline fitted per spectrum   (--fitter)
+    plot        fast_plot.render_columns of the result    (--plot)
+
+The outputs go to `<folder>/processed/`: combined_raw_store/ and
+referenced_raw_store/ (plus the CSVs with --csv), the windowed or
+baseline-corrected series as a store, the PNG, and batch_manifest.json.
+The manifest records the input files (size and mtime) and the settings; a
+folder whose manifest still matches is skipped, so rerunning the command
+after a few new experiments only processes those (--force redoes all).
+
+Only the stages that run import their dependencies: pybaselines and scipy
+for the baseline, matplotlib for the plot. A combine-only run loads
+neither, in the main process or in the workers.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from series_store import write_store
+from spectra_processing import (BKG_SUBTRACTED_STORE, COMBINED_STORE, REFERENCED_STORE, list_series_files,
+                                load_series, series_to_dataframe)
+
+OUTPUT_DIR = "processed"
+MANIFEST_FILE = "batch_manifest.json"
+SELECTED_STORE = "selected_store"
+# bumped when a stage changes its results, outdates every manifest
+BATCH_VERSION = 1
+
+
+def find_experiments(patterns):
+    """Folders matching any of `patterns` (paths or globs), sorted, without duplicates."""
+    folders = []
+    for pattern in patterns:
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        folders += sorted(path for path in matches if os.path.isdir(path))
+    return list(dict.fromkeys(os.path.abspath(folder) for folder in folders))
+
+
+def spectra_dir(folder):
+    # The processing scripts expect the spectra in ./raw, a bare folder works too
+    raw = os.path.join(folder, "raw")
+    return raw if os.path.isdir(raw) else folder
+
+
+def _settings(extension, wave_range, fitter, params, plot, csv, dtype):
+    return {
+        "version": BATCH_VERSION,
+        "extension": extension,
+        "window": None if wave_range is None else sorted(wave_range),
+        "fitter": fitter,
+        "params": params or {},
+        "plot": plot,
+        "csv": csv,
+        "dtype": np.dtype(dtype).name,
+    }
+
+
+def _outputs(settings):
+    outputs = [COMBINED_STORE, REFERENCED_STORE]
+    if settings["csv"]:
+        outputs += ["combined_raw.csv", "referenced_raw.csv"]
+    if settings["fitter"] is not None:
+        outputs.append(BKG_SUBTRACTED_STORE)
+    elif settings["window"] is not None:
+        outputs.append(SELECTED_STORE)
+    if settings["plot"]:
+        outputs.append(_plot_name(settings["window"]))
+    return outputs
+
+
+def _plot_name(window):
+    return f"spectrum_{None if window is None else tuple(window)}.png"
+
+
+def _file_stats(raw_dir, extension):
+    stats = {}
+    for file in list_series_files(raw_dir, extension):
+        stat = os.stat(os.path.join(raw_dir, file))
+        stats[file] = [stat.st_size, stat.st_mtime]
+    return stats
+
+
+def is_up_to_date(output_dir, manifest):
+    """True when output_dir holds a matching manifest and every output it lists."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), "r") as f:
+            previous = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    return previous == manifest and all(os.path.exists(os.path.join(output_dir, output))
+                                        for output in manifest["outputs"])
+
+
+def process_experiment(folder, extension=".csv", wave_range=None, fitter=None, params=None,
+                       plot=False, csv=False, dtype=np.float64, output=OUTPUT_DIR, force=False,
+                       read_workers=None):
+    """
+    Run the stages on one experiment folder.
+
+    Parameters
+    ----------
+    folder : str
+        Experiment folder; the spectra are in folder/raw or in folder itself.
+    wave_range : tuple[float, float] | None
+        Window kept for the baseline and the plot, exclusive bounds.
+    fitter : str | None
+        Baseline method (see baselines.FITTER_PARAMS), None skips the stage.
+    params : dict | None
+        Fitter parameters.
+    output : str
+        Output folder, relative to `folder`.
+    force : bool
+        Process the folder even when its outputs are up to date.
+    read_workers : int | None
+        Reader threads of the combine stage.
+
+    Returns
+    -------
+    dict
+        folder, status ("done", "skipped" or "failed"), error, seconds and
+        the time of every stage that ran.
+    """
+    start = time.perf_counter()
+    result = {"folder": folder, "status": "done", "error": None, "stages": {}}
+    try:
+        raw_dir = spectra_dir(folder)
+        output_dir = os.path.join(folder, output)
+        settings = _settings(extension, wave_range, fitter, params, plot, csv, dtype)
+        manifest = {"settings": settings, "files": _file_stats(raw_dir, extension),
+                    "outputs": _outputs(settings)}
+        if not force and is_up_to_date(output_dir, manifest):
+            result["status"] = "skipped"
+            return result
+        os.makedirs(output_dir, exist_ok=True)
+        _run_stages(raw_dir, output_dir, settings, result["stages"], read_workers)
+        with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=1)
+    except Exception as error:
+        # one bad folder must not stop the batch
+        result.update(status="failed", error=f"{type(error).__name__}: {error}")
+    finally:
+        result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _run_stages(raw_dir, output_dir, settings, stages, read_workers):
+    def timed(name, since):
+        now = time.perf_counter()
+        stages[name] = now - since
+        return now
+
+    clock = time.perf_counter()
+    wavenumber, names, intensities = load_series(raw_dir, workers=read_workers,
+                                                 extension=settings["extension"], dtype=settings["dtype"])
+    metadata = {"source": os.path.abspath(raw_dir), "reference": names[0]}
+    write_store(os.path.join(output_dir, COMBINED_STORE), wavenumber, names, intensities, metadata,
+                dtype=intensities.dtype)
+    clock = timed("combine", clock)
+
+    referenced = intensities - intensities[:, [0]]
+    write_store(os.path.join(output_dir, REFERENCED_STORE), wavenumber, names, referenced, metadata,
+                dtype=referenced.dtype)
+    if settings["csv"]:
+        series_to_dataframe(wavenumber, names, intensities).to_csv(
+            os.path.join(output_dir, "combined_raw.csv"), index=False)
+        series_to_dataframe(wavenumber, names, referenced).to_csv(
+            os.path.join(output_dir, "referenced_raw.csv"), index=False)
+    del intensities
+    clock = timed("reference", clock)
+
+    x, Y = wavenumber, referenced
+    if settings["window"] is not None:
+        from windowing import WindowSelector
+
+        x, Y = WindowSelector((x, Y)).select(settings["window"])
+        if settings["fitter"] is None:
+            write_store(os.path.join(output_dir, SELECTED_STORE), x, names, Y, metadata, dtype=Y.dtype)
+        clock = timed("window", clock)
+
+    if settings["fitter"] is not None:
+        from baselines import fit_baselines
+
+        _, Y, _ = fit_baselines(settings["fitter"], x, Y, **settings["params"])
+        write_store(os.path.join(output_dir, BKG_SUBTRACTED_STORE), x, names, Y,
+                    {**metadata, "fitter": settings["fitter"], "params": settings["params"]}, dtype=Y.dtype)
+        clock = timed("baseline", clock)
+
+    if settings["plot"]:
+        from fast_plot import render_columns
+
+        render_columns(x, Y, names, xlim=None if settings["window"] is None else tuple(settings["window"]),
+                       path=os.path.join(output_dir, _plot_name(settings["window"])))
+        timed("plot", clock)
+
+
+def run_batch(folders, workers=None, verbose=True, **options):
+    """
+    process_experiment for every folder in a process pool.
+
+    `options` are passed to process_experiment. Returns the results in the
+    order of `folders`.
+    """
+    workers = min(workers or os.cpu_count() or 1, max(len(folders), 1))
+    # the pool already keeps the CPUs busy, one reader thread per folder
+    options.setdefault("read_workers", 1 if workers > 1 else None)
+    results = []
+
+    def collect(result):
+        results.append(result)
+        if verbose:
+            print(format_result(result), flush=True)
+
+    if workers == 1:
+        for folder in folders:
+            collect(process_experiment(folder, **options))
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_experiment, folder, **options) for folder in folders]
+        for future in futures:
+            collect(future.result())
+    return results
+
+
+def format_result(result):
+    stages = " ".join(f"{name} {seconds:.2f}s" for name, seconds in result["stages"].items())
+    line = f"{result['status']:8s} {result['seconds']:7.2f} s  {result['folder']}"
+    if result["error"]:
+        return f"{line}\n         {result['error']}"
+    return f"{line}  ({stages})" if stages else line
+
+
+def _param(text):
+    # KEY=VALUE, the value read as JSON when it can be (numbers, true/false)
+    key, _, value = text.partition("=")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("experiments", nargs="+", help="experiment folders or glob patterns")
+    parser.add_argument("--extension", default=".csv", choices=(".csv", ".spa"))
+    parser.add_argument("--window", type=float, nargs=2, metavar=("LOW", "HIGH"),
+                        help="wave number window for the baseline and the plot")
+    parser.add_argument("--fitter", choices=("asls", "modpoly", "mor", "snip"),
+                        help="baseline method, no baseline correction if omitted")
+    parser.add_argument("--param", type=_param, action="append", default=[], metavar="KEY=VALUE",
+                        help="fitter parameter, e.g. --param lam=1e6 (repeatable)")
+    parser.add_argument("--plot", action="store_true", help="save a PNG of the result")
+    parser.add_argument("--csv", action="store_true", help="also write combined_raw.csv and referenced_raw.csv")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="output folder inside every experiment")
+    parser.add_argument("--workers", type=int, help="number of processes, default cpu count")
+    parser.add_argument("--force", action="store_true", help="process up-to-date folders again")
+    args = parser.parse_args()
+
+    folders = find_experiments(args.experiments)
+    if not folders:
+        parser.error("no experiment folder matches " + " ".join(args.experiments))
+    results = run_batch(folders, workers=args.workers, extension=args.extension,
+                        wave_range=None if args.window is None else tuple(args.window),
+                        fitter=args.fitter, params=dict(args.param), plot=args.plot, csv=args.csv,
+                        dtype=np.dtype(args.dtype), output=args.output, force=args.force)
+    counts = {status: sum(result["status"] == status for result in results)
+              for status in ("done", "skipped", "failed")}
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    raise SystemExit(1 if counts["failed"] else 0)
@@ -0,0 +1,144 @@
+"""
+Timing comparison for the processing functions on synthetic data.
+
+Run in any folder, everything is written to a temporary directory:
+
+    python benchmark_processing.py --spectra 1000 --points 6950 --workers 8
+"""
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import spectra_processing
+
+
+def write_synthetic_raw(csv_dir, n_spectra, n_points, seed=0):
+    # Omnic-like exports: "wavenumber,intensity" lines, no header, CRLF endings
+    os.makedirs(csv_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    x = np.linspace(4000, 650, n_points)
+    for i in range(n_spectra):
+        y = 0.05 * np.exp(-((x - 1650) / 30) ** 2) * i / n_spectra + rng.normal(0, 1e-4, n_points)
+        with open(os.path.join(csv_dir, "%04d.csv" % i), "w", newline="\r\n") as f:
+            f.write("\n".join(f"{a:.6f},{b:.6e}" for a, b in zip(x, y)))
+            f.write("\n")
+
+
+def legacy_combining_series(csv_dir):
+    # The original column-by-column loop, kept here as the timing baseline
+    warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+    csv_files = [f for f in os.listdir(csv_dir) if f.endswith('.csv')]
+    csv_files.sort()
+
+    combined_raw_df = pd.DataFrame()
+    referenced_raw_df = pd.DataFrame()
+
+    for idx, file in enumerate(csv_files):
+        df = pd.read_csv(os.path.join(csv_dir, file), header=None)
+        if idx == 0:
+            wavenumber = df.iloc[:, 0]
+            reference = df.iloc[:, 1]
+            combined_raw_df['Wave number'] = wavenumber
+            referenced_raw_df['Wave number'] = wavenumber
+        combined_raw_df[file.replace('.csv', '')] = df.iloc[:, 1]
+        referenced_raw_df[file.replace('.csv', '')] = df.iloc[:, 1] - reference
+
+    combined_raw_df.to_csv('combined_raw.csv', index=False)
+    referenced_raw_df.to_csv('referenced_raw.csv', index=False)
+    return combined_raw_df, referenced_raw_df
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_combining(n_spectra, n_points, workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            write_synthetic_raw("raw", n_spectra, n_points)
+            t_loop, (loop_combined, loop_referenced) = timed(legacy_combining_series, "raw")
+            t_bulk, (bulk_combined, bulk_referenced) = timed(
+                spectra_processing.combining_series, "raw", workers=workers)
+        finally:
+            os.chdir(cwd)
+
+    # Both paths must produce the same matrices
+    assert list(loop_combined.columns) == list(bulk_combined.columns)
+    np.testing.assert_allclose(loop_combined.to_numpy(), bulk_combined.to_numpy(), rtol=1e-12)
+    np.testing.assert_allclose(loop_referenced.to_numpy(), bulk_referenced.to_numpy(), atol=1e-12)
+
+    print(f"combining_series  {n_spectra} spectra x {n_points} points")
+    print(f"  column loop : {t_loop:8.3f} s")
+    print(f"  bulk ({workers} thr): {t_bulk:8.3f} s   speed-up x{t_loop / t_bulk:.1f}")
+
+
+def bench_baselines(n_spectra, n_points, fitters=("asls", "modpoly", "mor", "snip")):
+    rng = np.random.default_rng(0)
+    x = np.linspace(4000, 650, n_points)
+    Y = (0.2 + 2e-8 * (x[:, None] - 2000) ** 2
+         + 0.1 * np.exp(-((x[:, None] - 1650) / 25) ** 2) * rng.random(n_spectra)
+         + rng.normal(0, 1e-3, (n_points, n_spectra)))
+
+    print(f"baseline fitting  {n_spectra} spectra x {n_points} points")
+    for fitter in fitters:
+        t_loop, loop = timed(lambda: np.column_stack(
+            [spectra_processing.bkg_fitting(fitter, x, Y[:, col])[0] for col in range(n_spectra)]))
+        t_batch, (batch, _, info) = timed(spectra_processing.fit_baselines, fitter, x, Y)
+        error = np.abs(loop - batch).max() / np.abs(loop).max()
+        print(f"  {fitter:8s} per column: {t_loop:7.3f} s   batched: {t_batch:7.3f} s   "
+              f"x{t_loop / t_batch:.1f}   max rel. diff {error:.1e}   "
+              f"mean iterations {info['iterations'].mean():.1f}")
+
+
+def bench_parallel(n_spectra, n_points, fitter="asls", worker_counts=(1, 2, 4, 8, 16, 32)):
+    rng = np.random.default_rng(0)
+    x = np.linspace(4000, 650, n_points)
+    Y = 0.2 + 2e-8 * (x[:, None] - 2000) ** 2 + rng.normal(0, 1e-3, (n_points, n_spectra))
+
+    print(f"parallel {fitter}  {n_spectra} spectra x {n_points} points ({os.cpu_count()} CPUs)")
+    t_serial, (serial, _, _) = timed(spectra_processing.fit_baselines, fitter, x, Y)
+    print(f"  serial      : {t_serial:7.3f} s")
+    for workers in worker_counts:
+        t_par, (parallel, _, _) = timed(
+            spectra_processing.fit_baselines_parallel, fitter, x, Y, workers=workers)
+        assert np.array_equal(serial, parallel)
+        print(f"  {workers:2d} workers : {t_par:7.3f} s   x{t_serial / t_par:.1f}")
+
+
+def bench_warm_start(n_spectra, n_points, fitters=("asls", "modpoly")):
+    # slowly drifting baseline and a growing band, like a kinetic run
+    rng = np.random.default_rng(0)
+    x = np.linspace(4000, 650, n_points)
+    t = np.arange(n_spectra) / n_spectra
+    Y = (0.3 + 2e-8 * (1 + 0.5 * t) * (x[:, None] - 2000) ** 2
+         + 0.2 * t * np.exp(-((x[:, None] - 1650) / 20) ** 2)
+         + rng.normal(0, 1e-3, (n_points, n_spectra)))
+
+    print(f"warm start  {n_spectra} spectra x {n_points} points")
+    for fitter in fitters:
+        report = spectra_processing.compare_warm_start(fitter, x, Y)
+        print(f"  {fitter:8s} iterations cold {report['cold_iterations']:6d}   "
+              f"warm {report['warm_iterations']:6d}   saved {report['iterations_saved']:6d}   "
+              f"max rel. deviation {report['max_relative_deviation']:.1e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--spectra", type=int, default=500)
+    parser.add_argument("--points", type=int, default=6950)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    bench_combining(args.spectra, args.points, args.workers)
+    bench_baselines(args.spectra, args.points)
+    bench_parallel(args.spectra, args.points)
+    bench_warm_start(args.spectra, args.points)
@@ -0,0 +1,128 @@
+"""
+Scheduling benchmark for run_series with the simulated spectrometer.
+
+Runs thousands of short simulated collections in a temporary directory and
+reports how well run_series keeps to its schedule:
+
+    lateness   start of every collection minus its slot on the grid
+               (first start + slot * interval, see scheduler.py)
+    drift      lateness of the last collection, and its trend in ms per
+               1000 cycles
+    overhead   time run_series spends per cycle besides the collection
+               itself, and its phases from the telemetry log: macro,
+               dispatch, collection, detection, rename
+
+    python benchmark_series.py --interval 0.05 --count 2000 --json series_bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from scheduler import POLICIES
+from simulated_omnic import simulated_controller
+from spa_series import run_series
+
+
+def _ms(values):
+    values = np.asarray(values) * 1000
+    return {"mean": float(values.mean()), "p95": float(np.percentile(values, 95)), "max": float(values.max())}
+
+
+PHASES = ("macro", "dispatch", "collection", "detection", "rename")
+
+
+def bench_series(interval, count, delay, jitter=0.0, settle=0.005, policy="compress", n_points=500, seed=0):
+    """Run one simulated series and return its timing summary (times in ms)."""
+    controller = simulated_controller(delay=delay, jitter=jitter, n_points=n_points, seed=seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            controller.macro_path = os.path.join(tmp, "collect.mac")
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_series(settle=settle, controller=controller, interval=interval, count=count,
+                           collect_timeout=max(10 * interval, 10), policy=policy,
+                           telemetry="telemetry.jsonl")
+            wall = time.perf_counter() - start
+            with open("telemetry.jsonl") as f:
+                cycles = [json.loads(line) for line in f]
+        finally:
+            os.chdir(cwd)
+
+    if len(cycles) < count:
+        raise RuntimeError(f"only {len(cycles)} of {count} collections finished")
+    failed = {cycle["cycle"]: cycle["error"] for cycle in cycles if not cycle["ok"]}
+    if failed:
+        raise RuntimeError(f"collections failed (cycle: error): {failed}")
+
+    collections = controller.backend.collections
+    # lateness against the slot every collection was given, and drift against
+    # the grid (compress: slot i; skip: the slot after the skipped ones)
+    lateness = np.array([cycle["lateness"] for cycle in cycles])
+    trend = np.polyfit(np.arange(count), lateness, 1)[0] if count > 1 else 0.0
+    overruns = sum(cycle["cycle_time"] > interval for cycle in cycles)
+    overhead = [cycle["macro"] + cycle["dispatch"] + cycle["detection"] + cycle["rename"] for cycle in cycles]
+
+    result = {
+        "interval": interval,
+        "count": count,
+        "delay": delay,
+        "jitter": jitter,
+        "settle": settle,
+        "policy": policy,
+        "wall_s": wall,
+        "ideal_wall_s": interval * (count - 1) + float(np.mean([c["delay"] for c in collections])),
+        "overruns": int(overruns),
+        "skipped_slots": cycles[-1]["skipped"],
+        "lateness_ms": _ms(np.abs(lateness)),
+        "final_drift_ms": float(lateness[-1] * 1000),
+        "drift_ms_per_1000_cycles": float(trend * 1000 * 1000),
+        "overhead_ms": _ms(overhead),
+    }
+    for phase in PHASES:
+        result[f"{phase}_ms"] = _ms([cycle[phase] for cycle in cycles])
+    return result
+
+
+def print_report(result):
+    print(f"interval {result['interval']} s, {result['count']} cycles, collection {result['delay']} s "
+          f"+ up to {result['jitter']} s ({result['overruns']} longer than the interval), policy {result['policy']}")
+    print(f"  wall time       : {result['wall_s']:8.2f} s (ideal {result['ideal_wall_s']:.2f} s, "
+          f"{result['skipped_slots']} slots skipped)")
+    for key in ("lateness", "overhead") + PHASES:
+        stats = result[f"{key}_ms"]
+        print(f"  {key:<16}: mean {stats['mean']:7.2f} ms  p95 {stats['p95']:7.2f} ms  max {stats['max']:8.2f} ms")
+    print(f"  drift           : {result['final_drift_ms']:8.1f} ms at the end, "
+          f"{result['drift_ms_per_1000_cycles']:.1f} ms per 1000 cycles")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--delay", type=float, default=0.01, help="simulated collection time")
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument("--settle", type=float, default=0.005)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = [
+        # collections always fit in the interval
+        bench_series(args.interval, args.count, args.delay, args.jitter, args.settle),
+    ]
+    # some collections take longer than the interval
+    for policy in POLICIES:
+        results.append(bench_series(args.interval, args.count, args.delay, 0.6 * args.interval, args.settle,
+                                    policy=policy, seed=1))
+    for result in results:
+        print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
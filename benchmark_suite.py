@@ -0,0 +1,280 @@
+"""
+Benchmark suite for spectra_processing on synthetic FTIR series.
+
+Every public processing function is timed over a sweep of series sizes:
+the number of spectra is swept at a fixed number of points and the number
+of points at a fixed number of spectra. For each case the report has the
+wall time, the peak memory allocated during the call (tracemalloc, in a
+second run so tracing does not slow the timed one) and the throughput in
+spectra per second.
+
+    python benchmark_suite.py                                  # quick sweep
+    python benchmark_suite.py --spectra 10 100 1000 10000 --points 1000 7000 30000
+    python benchmark_suite.py --report new.json --compare old.json
+    python benchmark_suite.py --dtype float32                  # compact mode
+
+The report is a JSON file with the environment (versions, CPU count, git
+commit) and one record per function and size; --compare prints the time
+and memory ratios against an earlier report.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pybaselines
+
+import spectra_processing
+from bands import band_table
+
+FITTERS = ("asls", "modpoly", "mor", "snip")
+
+
+def synthetic_series(n_spectra, n_points, n_bands=6, noise=1e-3, seed=0):
+    """
+    A kinetic FTIR series: (x, Y) with Y of shape (n_points, n_spectra).
+
+    Bands are a mix of Gaussian and Lorentzian lines whose amplitudes rise or
+    decay along the series and whose centres shift slightly. They sit on a
+    curved baseline whose offset, slope and curvature drift over time.
+    Gaussian noise of standard deviation `noise` is added.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(4000, 650, n_points)
+    t = np.linspace(0, 1, n_spectra)
+    u = (x - 2325) / 1675  # x mapped to [-1, 1]
+
+    Y = np.empty((n_points, n_spectra), order="F")
+    # drifting baseline: offset, slope and curvature change slowly over time
+    offset = 0.2 + 0.05 * t + 0.01 * np.sin(2 * np.pi * t * rng.uniform(0.5, 2))
+    slope = 0.02 * (1 + 0.5 * t)
+    curvature = 0.05 * (1 - 0.3 * t)
+    Y[:] = offset + np.outer(u, slope) + np.outer(u ** 2, curvature)
+
+    for _ in range(n_bands):
+        centre = rng.uniform(900, 3600)
+        width = rng.uniform(8, 40)
+        height = rng.uniform(0.01, 0.2)
+        rate = rng.uniform(1, 6)
+        # half the bands grow (product), half decay (reactant)
+        amplitude = height * (1 - np.exp(-rate * t)) if rng.random() < 0.5 else height * np.exp(-rate * t)
+        centres = centre + rng.uniform(-3, 3) * t
+        d = (x[:, None] - centres) / width
+        if rng.random() < 0.5:
+            Y += amplitude * np.exp(-0.5 * d ** 2)
+        else:
+            Y += amplitude / (1 + d ** 2)
+
+    Y += rng.normal(0, noise, Y.shape)
+    return x, Y
+
+
+def write_series(folder, x, Y):
+    # Omnic-like CSV exports, "%04d.csv"
+    os.makedirs(folder, exist_ok=True)
+    for col in range(Y.shape[1]):
+        np.savetxt(os.path.join(folder, "%04d.csv" % col), np.column_stack([x, Y[:, col]]),
+                   delimiter=",", fmt="%.6f", newline="\r\n")
+
+
+def series_frame(x, Y):
+    return spectra_processing.series_to_dataframe(x, ["%04d" % col for col in range(Y.shape[1])],
+                                                  Y.astype(spectra_processing.DTYPE))
+
+
+def measure(fn, memory=True):
+    """Wall time (s) of fn(), and its peak traced allocation (bytes) from a second call."""
+    start = time.perf_counter()
+    fn()
+    wall = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return wall, peak
+
+
+def cases(n_spectra, n_points, fitters=FITTERS, plot_max_spectra=1000):
+    """(name, fitter, setup) for every benchmarked call; setup(tmp) returns the callable."""
+    def combining(tmp):
+        x, Y = synthetic_series(n_spectra, n_points)
+        write_series(os.path.join(tmp, "raw"), x, Y)
+        return lambda: spectra_processing.combining_series(os.path.join(tmp, "raw"))
+
+    def fitting(fitter):
+        def setup(tmp):
+            x, Y = synthetic_series(n_spectra, n_points)
+            return lambda: [spectra_processing.bkg_fitting(fitter, x, Y[:, col]) for col in range(n_spectra)]
+        return setup
+
+    def subtraction(fitter):
+        def setup(tmp):
+            df = series_frame(*synthetic_series(n_spectra, n_points))
+            return lambda: spectra_processing.bkg_subtraction(df, fitter)
+        return setup
+
+    def selection(tmp):
+        df = series_frame(*synthetic_series(n_spectra, n_points))
+        return lambda: spectra_processing.columns_selection(df, (1000, 1800), list(df.columns[1:]))
+
+    def band_analysis(tmp):
+        df = series_frame(*synthetic_series(n_spectra, n_points))
+        bands = [(low, low + 50) for low in np.linspace(900, 3500, 24)]
+        return lambda: band_table(df, bands, baseline="linear")
+
+    def plotting(tmp):
+        df = series_frame(*synthetic_series(n_spectra, n_points))
+
+        def plot():
+            spectra_processing.plot_columns(df, xlim=(1000, 1800))
+            plt.close("all")
+        return plot
+
+    def fast_plotting(tmp):
+        df = series_frame(*synthetic_series(n_spectra, n_points))
+        return lambda: spectra_processing.plot_columns(df, xlim=(1000, 1800), fast=True)
+
+    yield "combining_series", None, combining
+    for fitter in fitters:
+        yield "bkg_fitting", fitter, fitting(fitter)
+        yield "bkg_subtraction", fitter, subtraction(fitter)
+    yield "columns_selection", None, selection
+    yield "band_table", None, band_analysis
+    if n_spectra <= plot_max_spectra:
+        yield "plot_columns", None, plotting
+    yield "plot_columns", "fast", fast_plotting
+
+
+def run_suite(spectra_sizes, point_sizes, base_spectra, base_points, fitters=FITTERS, memory=True,
+              plot_max_spectra=1000, functions=None, verbose=True):
+    sizes = [(n, base_points) for n in spectra_sizes] + [(base_spectra, p) for p in point_sizes]
+    sizes = list(dict.fromkeys(sizes))  # keep order, drop the repeated base case
+
+    records = []
+    for n_spectra, n_points in sizes:
+        for name, fitter, setup in cases(n_spectra, n_points, fitters, plot_max_spectra):
+            if functions and name not in functions:
+                continue
+            with tempfile.TemporaryDirectory() as tmp:
+                cwd = os.getcwd()
+                os.chdir(tmp)  # the functions write their outputs in the current folder
+                try:
+                    wall, peak = measure(setup(tmp), memory)
+                finally:
+                    os.chdir(cwd)
+            record = {
+                "function": name,
+                "fitter": fitter,
+                "n_spectra": n_spectra,
+                "n_points": n_points,
+                "wall_s": wall,
+                "peak_mb": None if peak is None else peak / 2**20,
+                "spectra_per_s": n_spectra / wall if wall > 0 else None,
+            }
+            records.append(record)
+            if verbose:
+                print(format_record(record), flush=True)
+    return records
+
+
+def format_record(record):
+    name = record["function"] + (f"[{record['fitter']}]" if record["fitter"] else "")
+    peak = "" if record["peak_mb"] is None else f"{record['peak_mb']:9.1f} MB"
+    return (f"{name:26s} {record['n_spectra']:6d} x {record['n_points']:6d}  "
+            f"{record['wall_s']:9.3f} s {peak}  {record['spectra_per_s']:10.1f} spectra/s")
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "matplotlib": matplotlib.__version__,
+        "pybaselines": pybaselines.__version__,
+        "dtype": np.dtype(spectra_processing.DTYPE).name,
+    }
+
+
+def _key(record):
+    return record["function"], record["fitter"], record["n_spectra"], record["n_points"]
+
+
+def compare(old_report, new_report):
+    """Print the new/old ratios of wall time and peak memory for the cases in both reports."""
+    old = {_key(record): record for record in old_report["results"]}
+    print(f"\ncompared with {old_report['environment'].get('commit')} ({old_report['environment'].get('date')})")
+    print(f"{'case':44s} {'time':>8s} {'memory':>8s}")
+    for record in new_report["results"]:
+        before = old.get(_key(record))
+        if before is None:
+            continue
+        name = record["function"] + (f"[{record['fitter']}]" if record["fitter"] else "")
+        time_ratio = record["wall_s"] / before["wall_s"]
+        memory_ratio = (record["peak_mb"] / before["peak_mb"]
+                        if record["peak_mb"] is not None and before["peak_mb"] else float("nan"))
+        print(f"{name:26s} {record['n_spectra']:6d} x {record['n_points']:6d}  "
+              f"x{time_ratio:7.2f} x{memory_ratio:7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--spectra", type=int, nargs="+", default=[10, 100, 1000],
+                        help="numbers of spectra swept at --base-points")
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 7000],
+                        help="numbers of points swept at --base-spectra")
+    parser.add_argument("--base-spectra", type=int, default=100)
+    parser.add_argument("--base-points", type=int, default=7000)
+    parser.add_argument("--fitters", nargs="+", default=list(FITTERS), choices=FITTERS)
+    parser.add_argument("--functions", nargs="+", help="only these functions")
+    parser.add_argument("--plot-max-spectra", type=int, default=1000,
+                        help="skip plot_columns above this many spectra")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64",
+                        help="spectra_processing.DTYPE for the run")
+    parser.add_argument("--report", default="benchmark_report.json")
+    parser.add_argument("--compare", help="earlier report to compare with")
+    args = parser.parse_args()
+    spectra_processing.DTYPE = np.dtype(args.dtype)
+
+    # crowded legends (plot_columns) and fragmented frames (columns_selection)
+    # are what is being measured, not worth a warning per case
+    warnings.simplefilter("ignore", UserWarning)
+    warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+
+    report = {
+        "environment": environment(),
+        "results": run_suite(args.spectra, args.points, args.base_spectra, args.base_points,
+                             fitters=args.fitters, memory=not args.no_memory,
+                             plot_max_spectra=args.plot_max_spectra, functions=args.functions),
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.report}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
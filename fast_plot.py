@@ -0,0 +1,168 @@
+"""
+Fast plotting of many spectra.
+
+`render_columns` draws every spectrum of a window as one LineCollection
+coloured by time instead of one Line2D per column. Dense spectra are first
+reduced to the screen resolution by keeping the minimum and maximum of
+every pixel column, which looks the same but draws far fewer vertices. The
+figure is rendered on an Agg canvas and never touches pyplot, so nothing
+blocks or opens a window in headless runs.
+
+`render_batch` renders many windows or column subsets of the same series in
+a process pool; the data goes to the workers once, through shared memory.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+from matplotlib.ticker import AutoMinorLocator
+
+from instrumentation import instrumented
+from shared_arrays import attach_matrix, shared_series
+from windowing import WindowSelector, column_times
+
+
+def decimate_minmax(x, Y, n_bins):
+    """
+    Keep the minimum and maximum of every one of `n_bins` runs of points.
+
+    Returns (x, Y) with 2 * n_bins points; the input is returned unchanged
+    when it has no more points than that.
+    """
+    n_points = x.size
+    if n_points <= 2 * n_bins:
+        return x, Y
+    starts = np.linspace(0, n_points, n_bins + 1).astype(np.intp)[:-1]
+    ends = np.append(starts[1:], n_points) - 1
+    x_out = np.empty(2 * n_bins)
+    x_out[0::2] = x[starts]
+    x_out[1::2] = x[ends]
+    Y_out = np.empty((2 * n_bins, Y.shape[1]))
+    Y_out[0::2] = np.minimum.reduceat(Y, starts, axis=0)
+    Y_out[1::2] = np.maximum.reduceat(Y, starts, axis=0)
+    return x_out, Y_out
+
+
+@instrumented
+def render_columns(x, Y, names=None, xlim=None, ylim=None, reverse_x=True, interval=10, cmap="viridis",
+                   figsize=(5, 4), dpi=300, path=None, decimate=True):
+    """
+    Draw the columns of Y against x and return the Figure (saved to `path` if given).
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Wave numbers, sorted (either direction).
+    Y : np.ndarray
+        Spectra, one per column.
+    names : list[str] | None
+        Column names; they set the times of the colour scale (see column_times).
+    xlim, ylim : tuple[float, float] | None
+        Axis ranges; by default the whole x range and the min/max of all
+        spectra inside xlim.
+    interval : float
+        Minutes between spectra, for the colour bar.
+    decimate : bool
+        Reduce every spectrum to the pixel width of the axes first.
+    """
+    names = [str(col) for col in range(Y.shape[1])] if names is None else list(names)
+    if xlim is not None:
+        # only the points that can be seen are drawn
+        selector = WindowSelector((x, Y))
+        low, high = sorted(xlim)
+        rows = selector.rows((low, high))
+        x, Y = x[rows], Y[rows]
+    if ylim is None and Y.size:
+        ylim = (float(np.nanmin(Y)), float(np.nanmax(Y)))
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    if decimate and x.size:
+        x, Y = decimate_minmax(x, Y, int(figsize[0] * dpi))
+    segments = np.empty((Y.shape[1], x.size, 2))
+    segments[:, :, 0] = x
+    segments[:, :, 1] = Y.T
+    times = column_times(names, interval)
+    lines = LineCollection(segments, cmap=colormaps[cmap], linewidths=0.8,
+                           norm=Normalize(times.min(), times.max()) if times.size else None)
+    lines.set_array(times)
+    ax.add_collection(lines)
+    colorbar = fig.colorbar(lines, ax=ax)
+    colorbar.set_label("Time (min)")
+
+    ax.set_xlabel("Wavenumber (cm$^{-1}$)")
+    ax.set_ylabel("Absorbance (A.U.)")
+    ax.set_yticklabels([])
+    ax.xaxis.set_minor_locator(AutoMinorLocator(n=2))
+    if xlim is not None:
+        ax.set_xlim(xlim)
+    elif x.size:
+        ax.set_xlim(float(x.min()), float(x.max()))
+    if ylim is not None and ylim[0] < ylim[1]:
+        ax.set_ylim(ylim)
+    if reverse_x:
+        ax.invert_xaxis()
+
+    fig.tight_layout()
+    if path is not None:
+        fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    return fig
+
+
+# State of a pool worker, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(name, shape, names):
+    shm, data = attach_matrix(name, shape)
+    _worker.update(shm=shm, data=data, names=names)
+
+
+def _render_job(job):
+    job = dict(job)
+    cols = job.pop("cols", None)
+    names = _worker["names"]
+    x, Y = _worker["data"][:, 0], _worker["data"][:, 1:]
+    if cols is not None:
+        positions = [names.index(col) if isinstance(col, str) else col for col in cols]
+        Y, names = Y[:, positions], [names[pos] for pos in positions]
+    job.setdefault("path", f"spectrum_{job.get('xlim')}.png")
+    render_columns(x, Y, names, **job)
+    return job["path"]
+
+
+def render_batch(data, jobs, workers=None):
+    """
+    Render many plots of the same series in a process pool.
+
+    Parameters
+    ----------
+    data : pd.DataFrame | SeriesStore | tuple[np.ndarray, np.ndarray]
+        The series, as accepted by windowing.WindowSelector.
+    jobs : list[dict]
+        Keyword arguments of render_columns for every plot, plus "cols"
+        (spectrum names or positions, default all). "path" defaults to
+        spectrum_{xlim}.png.
+    workers : int | None
+        Number of processes, defaults to os.cpu_count().
+
+    Returns
+    -------
+    list[str]
+        The files written, in the order of `jobs`.
+    """
+    selector = WindowSelector(data)
+    x, Y = selector.x, selector.intensities
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+
+    with shared_series(x, Y) as (name, shape):
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(name, shape, list(map(str, selector.columns)))) as executor:
+            return list(executor.map(_render_job, jobs))
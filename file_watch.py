@@ -0,0 +1,165 @@
+"""
+Wait for output files to be completely written.
+
+`wait_for_files` returns as soon as every file exists, has not changed size
+or mtime for `settle` seconds and can be opened for reading. On Linux the
+folder is watched with inotify, so we wake up on the writer's events; on
+other systems (the Omnic PC runs Windows) it polls with an interval that
+starts small, grows while nothing happens and resets whenever a file shows
+up or grows.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class FileWaitTimeout(TimeoutError):
+    pass
+
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _readable(path):
+    # Omnic keeps the file locked while writing it on Windows
+    try:
+        with open(path, "rb"):
+            return True
+    except OSError:
+        return False
+
+
+class _Inotify:
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+
+    def wait(self, timeout):
+        # Returns the names touched since the last call (empty on timeout)
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        names = set()
+        if not readable:
+            return names
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return names
+        pos = 0
+        while pos + 16 <= len(buffer):
+            _, _, _, length = struct.unpack_from("iIII", buffer, pos)
+            names.add(buffer[pos + 16:pos + 16 + length].split(b"\0", 1)[0].decode(errors="replace"))
+            pos += 16 + length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _open_watcher(folder):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return _Inotify(folder)
+    except OSError:
+        return None
+
+
+def wait_for_files(paths, timeout=None, settle=0.2, poll_min=0.005, poll_max=0.1, use_inotify=True,
+                   info=None):
+    """
+    Block until every file in `paths` is complete.
+
+    Parameters
+    ----------
+    paths : list[str]
+        Files to wait for; they must be in the same folder.
+    timeout : float | None
+        Seconds before FileWaitTimeout is raised, None waits forever.
+    settle : float
+        How long size and mtime must stay unchanged to call a file complete.
+    poll_min, poll_max : float
+        Range of the polling interval when inotify is not used.
+    info : dict | None
+        If given, "appeared" is set to the seconds until every file existed;
+        the rest of the wait is spent on the files being written and settling.
+
+    Returns
+    -------
+    float
+        Seconds spent waiting.
+    """
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    folder = os.path.dirname(os.path.abspath(paths[0]))
+    watcher = _open_watcher(folder) if use_inotify else None
+
+    states = {path: None for path in paths}
+    stable_since = {path: None for path in paths}
+    interval = poll_min
+    try:
+        while True:
+            now = time.monotonic()
+            changed = False
+            for path in paths:
+                state = _file_state(path)
+                if state != states[path]:
+                    states[path] = state
+                    stable_since[path] = now if state is not None else None
+                    changed = True
+
+            if info is not None and "appeared" not in info and all(states[path] is not None for path in paths):
+                info["appeared"] = now - start
+
+            pending = [path for path in paths
+                       if stable_since[path] is None or now - stable_since[path] < settle]
+            if not pending and all(_readable(path) for path in paths):
+                return time.monotonic() - start
+
+            if deadline is not None and now >= deadline:
+                missing = [os.path.basename(path) for path in pending]
+                raise FileWaitTimeout(f"files not complete after {timeout} s: {', '.join(missing)}")
+
+            # Sleep until the earliest of: the next settle check, the deadline,
+            # and (when polling) the next poll
+            if changed:
+                interval = poll_min
+            else:
+                interval = min(interval * 1.5, poll_max)
+            wake = [stable_since[path] + settle - now for path in pending if stable_since[path] is not None]
+            if watcher is None:
+                wake.append(interval)
+            if deadline is not None:
+                wake.append(deadline - now)
+            delay = min(wake) if wake else poll_max
+
+            if watcher is not None:
+                # any event in the folder wakes us up early; without events
+                # there is nothing to re-check before the settle time is over
+                watcher.wait(delay if wake else 1.0)
+            else:
+                time.sleep(max(delay, 0))
+    finally:
+        if watcher is not None:
+            watcher.close()
@@ -0,0 +1,82 @@
+"""
+Putting spectra recorded on different wave number axes onto one grid.
+
+A change of resolution or range in the experiment file changes the axis
+Omnic writes. Axes are compared by a hash of their values, so checking a
+file costs one pass over its x column. A spectrum on another axis is
+linearly interpolated onto the target grid; the interpolation indices and
+weights depend only on the two axes, so they are computed once per distinct
+source axis and every spectrum on that axis is then resampled by one
+gather and one multiply-add for the whole batch.
+
+Target points outside a source axis are NaN.
+"""
+import hashlib
+
+import numpy as np
+
+
+def axis_key(x):
+    """Hash of a wave number axis; equal axes give equal keys."""
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    return hashlib.blake2b(x.tobytes(), digest_size=16).hexdigest()
+
+
+class GridResampler:
+    """
+    Linear interpolation onto a fixed target axis.
+
+    Parameters
+    ----------
+    target : array-like
+        The common grid, in any order.
+
+    Attributes
+    ----------
+    key : str
+        axis_key of the target.
+    """
+
+    def __init__(self, target):
+        self.target = np.asarray(target, dtype=np.float64)
+        self.key = axis_key(self.target)
+        # source axis key -> (lower row, upper row, weight of the upper row, inside)
+        self._weights = {}
+
+    def weights(self, x, key=None):
+        key = axis_key(x) if key is None else key
+        if key not in self._weights:
+            x = np.asarray(x, dtype=np.float64)
+            order = np.argsort(x, kind="stable")
+            ascending = x[order]
+            upper = np.clip(np.searchsorted(ascending, self.target), 1, max(x.size - 1, 1))
+            lower = upper - 1
+            span = ascending[upper] - ascending[lower]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                weight = np.where(span > 0, (self.target - ascending[lower]) / span, 0.0)
+            inside = (self.target >= ascending[0]) & (self.target <= ascending[-1])
+            # rows of the original (unsorted) source
+            self._weights[key] = (order[lower], order[upper], weight, inside)
+        return self._weights[key]
+
+    def resample(self, x, Y, key=None):
+        """Y (n_source_points, n_spectra) sampled on x -> (n_target_points, n_spectra)."""
+        Y = np.asarray(Y, dtype=np.float64)
+        lower, upper, weight, inside = self.weights(x, key)
+        squeeze = Y.ndim == 1
+        if squeeze:
+            Y = Y[:, None]
+        out = Y[lower] * (1 - weight)[:, None] + Y[upper] * weight[:, None]
+        out[~inside] = np.nan
+        return out[:, 0] if squeeze else out
+
+
+# One resampler per target axis, so the weights are kept between calls
+_resamplers = {}
+
+
+def get_resampler(target):
+    key = axis_key(target)
+    if key not in _resamplers:
+        _resamplers[key] = GridResampler(target)
+    return _resamplers[key]
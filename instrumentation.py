@@ -0,0 +1,314 @@
+"""
+Opt-in timing and memory instrumentation of the processing functions.
+
+The public functions of spectra_processing and the baseline fitters are
+wrapped with `instrumented`. Nothing is recorded (and the wrapper only
+checks one flag) unless a session is running, either for the whole process
+through the environment:
+
+    FTIR_INSTRUMENT=1                  text report on stderr at exit
+    FTIR_INSTRUMENT=report.json        JSON report written at exit (.txt: text)
+    FTIR_INSTRUMENT_MEMORY=0           no peak memory (tracemalloc slows allocations)
+    FTIR_INSTRUMENT_PROFILE=run.prof   cProfile of the whole session as well
+
+or for a block of code:
+
+    with instrument(report="report.json", profile="run.prof") as session:
+        combining_series()
+    print(session.text())
+
+Every call records its wall time, the rows and columns it processed (from
+the shape of its result, or of its input when it returns nothing) and its
+peak traced memory above what was allocated when it started. Calls that
+take a fitter are recorded per fitter ("bkg_fitting[asls]") with a
+histogram of their durations. Nested calls are recorded on their own and
+count in their caller's time and memory as well. The first call of a
+function includes the modules it imports on demand (scipy and pybaselines
+in bkg_subtraction, matplotlib in the plots), which can take seconds;
+compare later calls, or the p50, for the cost of the work itself.
+
+tracemalloc keeps one peak for the whole process, so memory is only
+recorded for calls in the main thread. Calls in reader threads
+(read_spectrum under read_series_files) record their time, their memory
+counts in the main thread call that started the threads.
+
+Only the calling process is measured; work done in process pools
+(workers > 1, render_batch, batch_processing) shows up as the time of the
+call that started the pool.
+"""
+import atexit
+import functools
+import inspect
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+ENV_VAR = "FTIR_INSTRUMENT"
+
+# The running session, None when instrumentation is off
+_session = None
+_lock = threading.Lock()
+
+
+def _shape(value):
+    # (rows, cols) of a DataFrame, array or store; the largest one in a tuple
+    if isinstance(value, (tuple, list)):
+        shapes = [shape for shape in map(_shape, value) if shape is not None]
+        return max(shapes, key=lambda shape: shape[0] * shape[1]) if shapes else None
+    if not hasattr(value, "shape") and hasattr(value, "data"):
+        value = value.data  # SeriesStore
+    shape = getattr(value, "shape", None)
+    if not isinstance(shape, tuple) or not shape:
+        return None
+    return int(shape[0]), int(shape[1]) if len(shape) > 1 else 1
+
+
+class _Stat:
+    def __init__(self):
+        self.durations = []
+        self.rows = 0
+        self.cols = 0
+        self.peak = None
+
+    def add(self, duration, shape, peak):
+        self.durations.append(duration)
+        if shape is not None:
+            self.rows += shape[0]
+            self.cols += shape[1]
+        if peak is not None:
+            self.peak = peak if self.peak is None else max(self.peak, peak)
+
+    def summary(self, name, histogram_bins=10):
+        durations = np.array(self.durations)
+        record = {
+            "name": name,
+            "calls": int(durations.size),
+            "total_s": float(durations.sum()),
+            "mean_s": float(durations.mean()),
+            "p50_s": float(np.percentile(durations, 50)),
+            "p90_s": float(np.percentile(durations, 90)),
+            "max_s": float(durations.max()),
+            "rows": self.rows,
+            "cols": self.cols,
+            "peak_mb": None if self.peak is None else self.peak / 2**20,
+        }
+        if "[" in name and durations.size > 1:
+            # log-spaced bins, call durations span orders of magnitude
+            low, high = max(durations.min(), 1e-7), max(durations.max(), 1e-7)
+            edges = np.geomspace(low, high * (1 + 1e-9), histogram_bins + 1) if high > low else np.array([low, high])
+            counts, edges = np.histogram(durations, bins=edges)
+            record["histogram"] = {"edges_s": edges.tolist(), "counts": counts.tolist()}
+        return record
+
+
+class Session:
+    """
+    Records the instrumented calls between start() and stop().
+
+    Parameters
+    ----------
+    report : str | None
+        Where stop() writes the report: "stderr", a .json path (JSON) or
+        any other path (text). None writes nothing.
+    memory : bool
+        Record peak memory with tracemalloc.
+    profile : str | None
+        Also run cProfile and dump its stats to this path.
+    """
+
+    def __init__(self, report=None, memory=True, profile=None):
+        self.report = report
+        self.memory = memory
+        self.profile = profile
+        self.stats = {}
+        self.started = None
+        self.wall = None
+        self._local = threading.local()
+        self._profiler = None
+        self._tracing = False
+
+    def start(self):
+        global _session
+        if _session is not None:
+            raise RuntimeError("An instrumentation session is already running")
+        if self.memory:
+            import tracemalloc
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+        if self.profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self.started = time.perf_counter()
+        _session = self
+        return self
+
+    def stop(self):
+        global _session
+        _session = None
+        self.wall = time.perf_counter() - self.started
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile)
+        if self._tracing:
+            import tracemalloc
+            tracemalloc.stop()
+        if self.report is not None:
+            self.write(self.report)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # --- recording ---------------------------------------------------------
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self):
+        frame = {"start": time.perf_counter(), "base": None, "peak": 0}
+        # resetting the one process-wide peak from another thread would hide
+        # what the main thread's open calls reached so far
+        if self.memory and threading.current_thread() is threading.main_thread():
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            # the callers keep the peak reached so far, it is reset for this call
+            for caller in self._stack():
+                caller["peak"] = max(caller["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["base"] = current
+        self._stack().append(frame)
+        return frame
+
+    def _exit(self, frame, name, shape):
+        duration = time.perf_counter() - frame["start"]
+        self._stack().pop()
+        peak = None
+        if frame["base"] is not None:
+            import tracemalloc
+            _, traced_peak = tracemalloc.get_traced_memory()
+            frame["peak"] = max(frame["peak"], traced_peak)
+            peak = frame["peak"] - frame["base"]
+            for caller in self._stack():
+                caller["peak"] = max(caller["peak"], frame["peak"])
+        with _lock:
+            self.stats.setdefault(name, _Stat()).add(duration, shape, peak)
+
+    # --- reporting ---------------------------------------------------------
+
+    def summary(self):
+        """One record per function (and fitter), slowest total first."""
+        records = [stat.summary(name) for name, stat in self.stats.items()]
+        return sorted(records, key=lambda record: record["total_s"], reverse=True)
+
+    def to_dict(self):
+        return {"wall_s": self.wall, "memory": self.memory, "profile": self.profile,
+                "functions": self.summary()}
+
+    def text(self, top=15):
+        lines = [f"{'function':32s} {'calls':>6s} {'total':>9s} {'mean':>9s} {'p90':>9s} "
+                 f"{'rows':>9s} {'cols':>7s} {'peak MB':>8s}"]
+        for record in self.summary():
+            peak = "" if record["peak_mb"] is None else f"{record['peak_mb']:8.1f}"
+            lines.append(f"{record['name']:32s} {record['calls']:6d} {record['total_s']:8.3f}s "
+                         f"{record['mean_s']:8.4f}s {record['p90_s']:8.4f}s "
+                         f"{record['rows']:9d} {record['cols']:7d} {peak}")
+            if "histogram" in record:
+                counts = record["histogram"]["counts"]
+                edges = record["histogram"]["edges_s"]
+                bars = " ".join(str(count) for count in counts)
+                lines.append(f"{'':32s} histogram {edges[0]:.2g}-{edges[-1]:.2g} s: {bars}")
+        if self.wall is not None:
+            lines.append(f"session wall time {self.wall:.3f} s")
+        if self._profiler is not None:
+            import io
+            import pstats
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats("cumulative").print_stats(top)
+            lines.append(stream.getvalue())
+        return "\n".join(lines)
+
+    def write(self, report):
+        if report == "stderr":
+            print(self.text(), file=sys.stderr)
+        elif report.endswith(".json"):
+            with open(report, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+        else:
+            with open(report, "w") as f:
+                f.write(self.text() + "\n")
+
+
+def instrument(report=None, memory=True, profile=None):
+    """Context manager running a Session, see the module docstring."""
+    return Session(report, memory, profile)
+
+
+def current_session():
+    return _session
+
+
+def instrumented(func=None, name=None, fitter=None):
+    """
+    Record the calls of `func` while a session runs.
+
+    `fitter(arguments)` returns the fitter of a call from its bound
+    arguments; the call is then recorded as "name[fitter]".
+
+    The wrapper is one more frame on the stack, session or not: a
+    `warnings.warn` in `func` needs one more stacklevel to point at the
+    caller.
+    """
+    if func is None:
+        return functools.partial(instrumented, name=name, fitter=fitter)
+    name = name or func.__name__
+    signature = inspect.signature(func) if fitter is not None else None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        session = _session
+        if session is None:
+            return func(*args, **kwargs)
+        label = name
+        if fitter is not None:
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            label = f"{name}[{fitter(arguments)}]"
+        frame = session._enter()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            shape = _shape(result)
+            if shape is None:
+                shape = _shape(args)
+            session._exit(frame, label, shape)
+    return wrapper
+
+
+def _from_environment():
+    value = os.environ.get(ENV_VAR, "")
+    # pool workers inherit the variable, only the main process reports
+    if value.lower() in ("", "0", "false", "no") or multiprocessing.parent_process() is not None:
+        return
+    report = "stderr" if value.lower() in ("1", "true", "yes", "text") else value
+    session = Session(report=report,
+                      memory=os.environ.get(ENV_VAR + "_MEMORY", "1").lower() not in ("0", "false", "no"),
+                      profile=os.environ.get(ENV_VAR + "_PROFILE") or None)
+    session.start()
+    atexit.register(session.stop)
+
+
+_from_environment()
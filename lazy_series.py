@@ -0,0 +1,210 @@
+"""
+Lazy processing of a combined series.
+
+`LazySeries` wraps a store (or a DataFrame) and only records what is asked
+of it; nothing is read or computed until the result is needed:
+
+    series = LazySeries("combined_raw_store")
+    plan = series.reference().select((1000, 1800), cols=["0003", "0010"]).baseline("asls")
+    x, Y = plan.array()          # or plan.frame(), plan.plot(), plan.export(path)
+
+When a plan runs, the steps are fused: the column selections are pushed
+down to the read, so only the requested spectra (and the reference) are
+read, and only the rows of the widest window still needed, which is the
+window in force at the first baseline step. Everything after that works on
+those arrays in memory. No intermediate DataFrame or CSV is made.
+
+Results are remembered on the series a plan was built from. Baselines are
+remembered per spectrum, so asking for more columns later only fits the
+new ones, and rerunning a plan costs nothing.
+"""
+import numpy as np
+import pandas as pd
+
+from baselines import fit_baselines, fitter_params, float_dtype
+from series_store import open_store, write_store
+from windowing import WindowSelector
+
+
+class _Source:
+    # What all the plans of one LazySeries share: the indexed axis and the memo
+    def __init__(self, data):
+        if isinstance(data, str):
+            data = open_store(data)
+        self.data = data
+        self.selector = WindowSelector(data)
+        self.results = {}
+        self.baselines = {}
+        self.reads = 0
+
+
+def _intersect(window, wave_range):
+    if wave_range is None:
+        return window
+    low, high = sorted(wave_range)
+    return max(window[0], low), min(window[1], high)
+
+
+class LazySeries:
+    """
+    Parameters
+    ----------
+    data : str | SeriesStore | pd.DataFrame | tuple[np.ndarray, np.ndarray]
+        A store folder or anything windowing.WindowSelector accepts.
+    """
+
+    def __init__(self, data, _source=None, _steps=()):
+        self._source = _Source(data) if _source is None else _source
+        self._steps = _steps
+
+    def __repr__(self):
+        steps = " -> ".join(step[0] for step in self._steps) or "source"
+        return f"LazySeries({steps})"
+
+    def _then(self, *step):
+        return LazySeries(None, self._source, self._steps + (step,))
+
+    # --- recording -------------------------------------------------------
+
+    def select(self, wave_range=None, cols=None):
+        """Keep wave_range[0] < x < wave_range[1] and the spectra `cols` (names or positions)."""
+        return self._then("select", None if wave_range is None else tuple(sorted(wave_range)),
+                          None if cols is None else tuple(cols))
+
+    def reference(self, ref=0):
+        """Subtract the spectrum `ref` (name or position in the source, default the first one)."""
+        if not isinstance(ref, str):
+            ref = self._source.selector.columns[ref]
+        return self._then("reference", ref)
+
+    def baseline(self, fitter, **params):
+        """Subtract a baseline fitted with `fitter` (see baselines.FITTER_PARAMS)."""
+        params = fitter_params(fitter, **params)
+        return self._then("baseline", fitter, tuple(sorted(params.items())))
+
+    # --- planning ----------------------------------------------------------
+
+    def _plan(self):
+        # Final columns (positions in the source) and the window to read
+        selector = self._source.selector
+        cols = list(range(len(selector.columns)))
+        window = (-np.inf, np.inf)
+        read_window = None
+        for step in self._steps:
+            if step[0] == "select":
+                window = _intersect(window, step[1])
+                if step[2] is not None:
+                    # names and positions both refer to the spectra left by
+                    # the steps before, not to the whole source
+                    current = {selector.columns[pos]: pos for pos in cols}
+                    for col in step[2]:
+                        if isinstance(col, str) and col not in current:
+                            raise KeyError(f"Column '{col}' not found in the selected spectra.")
+                    cols = [current[col] if isinstance(col, str) else cols[col] for col in step[2]]
+            elif step[0] == "baseline" and read_window is None:
+                read_window = window
+        return cols, (window if read_window is None else read_window), window
+
+    def explain(self):
+        """What running the plan reads: number of rows, spectra and the windows."""
+        cols, read_window, window = self._plan()
+        n_rows = np.arange(len(self._source.selector))[self._source.selector.rows(read_window)].size
+        refs = {step[1] for step in self._steps if step[0] == "reference"}
+        return {"rows": int(n_rows), "spectra": len(cols), "references": sorted(refs),
+                "read_window": read_window, "window": window,
+                "steps": [step[0] for step in self._steps]}
+
+    # --- running -----------------------------------------------------------
+
+    def _signature(self, upto=None):
+        # The steps without their column subsets: per-column results do not
+        # depend on which other columns are computed
+        steps = self._steps if upto is None else self._steps[:upto]
+        return tuple(step[:2] if step[0] == "select" else step for step in steps)
+
+    def _run(self):
+        source = self._source
+        selector = source.selector
+        cols, read_window, _ = self._plan()
+        names = [selector.columns[pos] for pos in cols]
+        key = (self._signature(), tuple(names))
+        if key in source.results:
+            return source.results[key]
+
+        read_rows = selector.rows(read_window)
+        # only these rows and spectra are read from the file (a slice of the
+        # memory map first, so the other rows are never touched)
+        source.reads += 1
+        x = np.asarray(selector.x[read_rows], dtype=np.float64)
+        # a float32 (compact) series is processed as float32
+        Y = np.asarray(selector.intensities[read_rows][:, cols], dtype=float_dtype(selector.intensities.dtype))
+        rows = np.arange(len(selector))[read_rows]
+        window = read_window
+        for index, step in enumerate(self._steps):
+            if step[0] == "select":
+                window = _intersect(window, step[1])
+                keep = WindowSelector((x, Y)).rows(window)
+                x, Y, rows = x[keep], Y[keep], rows[keep]
+            elif step[0] == "reference":
+                ref = selector._positions[step[1]]
+                Y = Y - np.asarray(selector.intensities[rows, ref], dtype=Y.dtype)[:, None]
+            elif step[0] == "baseline":
+                Y = Y - self._baselines(index, step, x, Y, names)
+        # the arrays are shared with later runs of the same plan
+        x.flags.writeable = False
+        Y.flags.writeable = False
+        result = (x, Y, names)
+        source.results[key] = result
+        return result
+
+    def _baselines(self, index, step, x, Y, names):
+        # Fit only the spectra that have not been fitted at this point of the plan
+        memo = self._source.baselines.setdefault(self._signature(index + 1), {})
+        missing = [col for col, name in enumerate(names) if name not in memo]
+        if missing:
+            baselines, _, _ = fit_baselines(step[1], x, Y[:, missing], **dict(step[2]))
+            for idx, col in enumerate(missing):
+                memo[names[col]] = baselines[:, idx]
+        return np.column_stack([memo[name] for name in names]) if names else np.empty_like(Y)
+
+    def array(self):
+        """(x, Y) of the plan, Y with one column per spectrum."""
+        x, Y, _ = self._run()
+        return x, Y
+
+    def frame(self):
+        x, Y, names = self._run()
+        df = pd.DataFrame(Y, columns=names, copy=False)
+        df.insert(0, "Wave number", x)
+        return df
+
+    @property
+    def columns(self):
+        cols, _, _ = self._plan()
+        return [self._source.selector.columns[pos] for pos in cols]
+
+    def export(self, path, metadata=None):
+        """Write the result to a .csv file, or to a store folder for any other path."""
+        x, Y, names = self._run()
+        if path.endswith(".csv"):
+            self.frame().to_csv(path, index=False)
+        else:
+            write_store(path, x, names, Y, metadata)
+        return path
+
+    def plot(self, path=None, **kwargs):
+        """Render with fast_plot.render_columns (headless); xlim defaults to the selected window."""
+        # imported here so loading this module does not pull in matplotlib
+        from fast_plot import render_columns
+
+        x, Y, names = self._run()
+        _, _, window = self._plan()
+        if "xlim" not in kwargs and np.all(np.isfinite(window)):
+            kwargs["xlim"] = window
+        if path is None:
+            path = f"spectrum_{kwargs.get('xlim')}.png"
+        return render_columns(x, Y, names, path=path, **kwargs)
+
+    def clear_cache(self):
+        self._source.results.clear()
+        self._source.baselines.clear()
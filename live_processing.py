@@ -0,0 +1,142 @@
+"""
+Process spectra while the series is still being collected.
+
+`LiveProcessor` runs a worker thread fed by a queue. `run_series` hands it
+every renamed spectrum and goes straight back to its schedule; the worker
+parses the file, appends it to the combined and referenced stores, and
+appends its baseline-corrected window to a third store. When the last
+collection is done only the last spectrum is left to process.
+
+submit() never blocks, so the collection schedule does not depend on how
+long processing takes. The heavy parts (parsing, the banded solves) run in
+NumPy/SciPy code that releases the GIL.
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from baselines import BatchBaseline
+from series_store import append_to_store, write_store
+from spectra_processing import BKG_SUBTRACTED_STORE, COMBINED_STORE, REFERENCED_STORE, read_spectrum
+
+_STOP = object()
+
+
+class LiveProcessor:
+    """
+    Parameters
+    ----------
+    output_dir : str
+        Folder for combined_raw_store/, referenced_raw_store/ and
+        bkg_subtracted_store/.
+    fitter : str | None
+        Baseline method (see baselines.FITTER_PARAMS); None skips the
+        baseline step.
+    wave_range : tuple[float, float] | None
+        Window that is baseline-corrected, exclusive bounds like
+        columns_selection. None uses the whole axis.
+    baseline_source : str
+        "referenced" or "combined", the spectra the baseline is fitted to.
+    **params
+        Fitter parameters.
+
+    Attributes
+    ----------
+    processed : int
+        Number of spectra done.
+    timings : list[float]
+        Processing time of every spectrum, in seconds.
+    errors : list[tuple[str, Exception]]
+        Files that failed; the worker carries on with the next one.
+    """
+
+    def __init__(self, output_dir=".", fitter="asls", wave_range=None,
+                 baseline_source="referenced", **params):
+        if baseline_source not in ("referenced", "combined"):
+            raise ValueError("baseline_source must be 'referenced' or 'combined'")
+        self.output_dir = output_dir
+        self.fitter = fitter
+        self.wave_range = wave_range
+        self.baseline_source = baseline_source
+        self.params = params
+
+        self.processed = 0
+        self.timings = []
+        self.errors = []
+        self._reference = None
+        self._window = None
+        self._x_window = None
+        self._baseline_fitter = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="LiveProcessor", daemon=True)
+        self._thread.start()
+
+    def submit(self, path):
+        # Never blocks: the queue is unbounded and the work happens in the thread
+        self._queue.put_nowait(path)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self, timeout=None):
+        """Process what is still queued, then stop the worker."""
+        self._queue.put_nowait(_STOP)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _store(self, name):
+        return os.path.join(self.output_dir, name)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is _STOP:
+                return
+            start = time.perf_counter()
+            try:
+                self._process(path)
+                self.processed += 1
+            except Exception as e:
+                self.errors.append((path, e))
+            self.timings.append(time.perf_counter() - start)
+
+    def _process(self, path):
+        x, y = read_spectrum(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        metadata = {"mtime": [os.path.getmtime(path)]}
+
+        if self._reference is None:
+            # the first spectrum is the reference and fixes the axis
+            self._reference = y
+            write_store(self._store(COMBINED_STORE), x, [name], y[:, None],
+                        {"source": os.path.abspath(os.path.dirname(path)), "reference": name, **metadata})
+            write_store(self._store(REFERENCED_STORE), x, [name], np.zeros((y.size, 1)),
+                        {"source": os.path.abspath(os.path.dirname(path)), "reference": name, **metadata})
+            if self.fitter is not None:
+                if self.wave_range is not None:
+                    self._window = (x > self.wave_range[0]) & (x < self.wave_range[1])
+                else:
+                    self._window = np.ones(x.size, dtype=bool)
+                self._baseline_fitter = BatchBaseline(x[self._window], self.fitter, **self.params)
+                self._x_window = x[self._window]
+            first = True
+        else:
+            if y.size != self._reference.size:
+                raise ValueError(f"{path} has {y.size} points, expected {self._reference.size}")
+            append_to_store(self._store(COMBINED_STORE), [name], y[:, None], metadata)
+            append_to_store(self._store(REFERENCED_STORE), [name], (y - self._reference)[:, None], metadata)
+            first = False
+
+        if self._baseline_fitter is None:
+            return
+        source = y - self._reference if self.baseline_source == "referenced" else y
+        _, corrected, _ = self._baseline_fitter.fit(source[self._window])
+        if first:
+            write_store(self._store(BKG_SUBTRACTED_STORE), self._x_window, [name], corrected[:, None],
+                        {"fitter": self.fitter, "wave_range": self.wave_range,
+                         "baseline_source": self.baseline_source, **metadata})
+        else:
+            append_to_store(self._store(BKG_SUBTRACTED_STORE), [name], corrected[:, None], metadata)
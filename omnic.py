@@ -0,0 +1,273 @@
+"""
+Talking to Omnic.
+
+`AcquisitionController` owns the COM session for a whole series: it connects
+once, rewrites collect.mac from a template prepared once (only the sample
+name changes between collections) and reconnects only when a command
+fails. The instrument side is a backend object with four methods:
+
+    connect()            open the session
+    short_path(path)     path as Omnic wants it in RunMacro
+    execute(command)     send one Omnic command
+    close()              drop the session
+
+`OmnicBackend` is the real one (COM through pywin32, imported only when it
+connects, so this module loads on any system); `FakeOmnicBackend` records
+the commands instead and lets the controller run on Linux.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+# Omnic reads macros in the Windows code page
+MACRO_ENCODING = "ansi" if sys.platform == "win32" else "cp1252"
+
+_SAMPLE = "\0sample\0"
+
+_MACRO = """OmnicMacroFile Version 10.0,
+caption,Macros\\Basic - collect.mac
+>pName,collect.mac
+>pComments,
+>pAuthor,Haochen Zhang
+>pReset,true
+>pFormat,?
+§
+send updateReadout "Open Experiment", 1
+send executeOmnic "[LoadParameters " & getRTSFN("C:\\my documents\\omnic\\Param\\Haochen_Default.exp") & "]"
+send updateReadout "Collect Sample", 2
+send enableApp false
+send executeOmnic "[Invoke CollectSample ""spectrum_{sample}"" AUTO POLLING]"
+send waitOnInvoke "CollectSample"
+{csv_export}send updateReadout "Save As", 4
+send executeOmnic "[Export " & getRTSFN("processing.spa") & "]"
+sysError = "ok"
+send updateReadout
+§
+false
+§
+Button,Open Experiment
+strokeColor,240,50,100
+>pTaskType,3
+>pAlias,LoadParameters
+>pParamList,"C:\\my documents\\omnic\\Param\\Haochen_Default.exp",false,1,1,1,1
+¡endTask!
+Button,Collect Sample
+strokeColor,240,50,100
+>pTaskType,3
+>pAlias,CollectSample
+>pParamList,"spectrum_{sample}",true,false,false
+¡endTask!
+{csv_button}Button,Save As
+strokeColor,240,50,100
+>pTaskType,3
+>pAlias,SaveAs
+>pParamList,"processing.spa",false
+¡endTask!
+§
+"""
+
+# With export_csv=False only processing.spa is written; spectra_processing
+# reads the .spa files directly (combining_series(extension=".spa"))
+_CSV_EXPORT = """send updateReadout "Save As", 3
+send executeOmnic "[Export " & getRTSFN("processing.csv") & "]"
+"""
+
+_CSV_BUTTON = """Button,Save As
+strokeColor,240,50,100
+>pTaskType,3
+>pAlias,SaveAs
+>pParamList,"processing.csv",false
+¡endTask!
+"""
+
+
+class MacroTemplate:
+    """
+    collect.mac with everything but the sample name encoded once.
+
+    render(sample_name) returns the bytes of the macro, write() puts them in
+    a file with a single write.
+    """
+
+    def __init__(self, export_csv=True):
+        self.export_csv = export_csv
+        text = _MACRO.format(sample=_SAMPLE,
+                             csv_export=_CSV_EXPORT if export_csv else "",
+                             csv_button=_CSV_BUTTON if export_csv else "")
+        self._parts = [part.encode(MACRO_ENCODING) for part in text.split(_SAMPLE)]
+
+    def render(self, sample_name):
+        return str(sample_name).encode(MACRO_ENCODING).join(self._parts)
+
+    def write(self, sample_name, path="collect.mac"):
+        with open(path, "wb") as f:
+            f.write(self.render(sample_name))
+
+
+class OmnicBackend:
+    """Omnic through its COM interface (Windows, needs pywin32)."""
+
+    def __init__(self, prog_id="OmnicApp.OmnicApp"):
+        self.prog_id = prog_id
+        self._app = None
+
+    def connect(self):
+        import win32com.client
+        self._app = win32com.client.Dispatch(self.prog_id)
+
+    def short_path(self, path):
+        import win32api
+        return win32api.GetShortPathName(path)
+
+    def execute(self, command):
+        self._app.ExecuteCommand(command)
+
+    def close(self):
+        self._app = None
+
+
+class FakeOmnicBackend:
+    """
+    Stand-in for Omnic that records what it is asked to do.
+
+    `fail` makes the next n commands raise, to exercise reconnection.
+    Subclasses override `run_macro(path)` to act on the macro.
+    """
+
+    def __init__(self):
+        self.connected = False
+        self.connections = 0
+        self.commands = []
+        self.fail = 0
+
+    def connect(self):
+        self.connected = True
+        self.connections += 1
+
+    def short_path(self, path):
+        return path
+
+    def execute(self, command):
+        if not self.connected:
+            raise RuntimeError("not connected")
+        if self.fail > 0:
+            self.fail -= 1
+            self.connected = False
+            raise RuntimeError("simulated COM failure")
+        self.commands.append(command)
+        if command.startswith("RunMacro "):
+            self.run_macro(command[len("RunMacro "):])
+
+    def run_macro(self, path):
+        pass
+
+    def close(self):
+        self.connected = False
+
+
+class AcquisitionController:
+    """
+    Parameters
+    ----------
+    backend : object | None
+        See the module docstring; None uses OmnicBackend().
+    export_csv : bool
+        Whether the macro also exports processing.csv.
+    macro_path : str
+        Where collect.mac is written.
+    retries : int
+        Reconnections tried when a command fails before giving up on a
+        collection.
+
+    Attributes
+    ----------
+    timings : list[dict]
+        Per collection: sample name, "start" (perf_counter time),
+        "macro" (seconds to write collect.mac),
+        "dispatch" (seconds until Omnic accepted RunMacro), "reconnects"
+        and "ok".
+    """
+
+    def __init__(self, backend=None, export_csv=True, macro_path="collect.mac", retries=1):
+        self.backend = OmnicBackend() if backend is None else backend
+        self.export_csv = export_csv
+        self.macro_path = os.path.abspath(macro_path)
+        self.retries = retries
+        self.template = MacroTemplate(export_csv)
+        self.timings = []
+        self._connected = False
+        self._short_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def outputs(self):
+        return ["processing.spa", "processing.csv"] if self.export_csv else ["processing.spa"]
+
+    def connect(self):
+        if not self._connected:
+            self.backend.connect()
+            self._connected = True
+
+    def close(self):
+        if self._connected:
+            self.backend.close()
+            self._connected = False
+
+    def write_macro(self, sample_name):
+        self.template.write(sample_name, self.macro_path)
+
+    def dispatch(self):
+        """Run collect.mac in Omnic; returns the number of reconnections needed."""
+        reconnects = 0
+        while True:
+            try:
+                self.connect()
+                if self._short_path is None:
+                    # the macro file keeps its path, resolve it only once
+                    self._short_path = self.backend.short_path(self.macro_path)
+                self.backend.execute(f"RunMacro {self._short_path}")
+                return reconnects
+            except Exception:
+                self.close()
+                if reconnects >= self.retries:
+                    raise
+                reconnects += 1
+
+    def collect(self, sample_name):
+        """Write the macro for `sample_name` and start it. Returns True on success."""
+        start = time.perf_counter()
+        timing = {"sample": sample_name, "start": start}
+        self.write_macro(sample_name)
+        written = time.perf_counter()
+        timing["macro"] = written - start
+        try:
+            timing["reconnects"] = self.dispatch()
+            timing["ok"] = True
+        except Exception as e:
+            print(f"ERROR running macro: {e}")
+            timing["reconnects"] = self.retries
+            timing["ok"] = False
+        timing["dispatch"] = time.perf_counter() - written
+        self.timings.append(timing)
+        return timing["ok"]
+
+    def latency_stats(self):
+        """Summary of the dispatch latencies so far, in seconds."""
+        latencies = np.array([timing["dispatch"] for timing in self.timings])
+        if latencies.size == 0:
+            return {"count": 0}
+        return {
+            "count": int(latencies.size),
+            "mean": float(latencies.mean()),
+            "median": float(np.median(latencies)),
+            "p95": float(np.percentile(latencies, 95)),
+            "max": float(latencies.max()),
+            "failures": sum(not timing["ok"] for timing in self.timings),
+        }
@@ -0,0 +1,160 @@
+"""
+Streaming processing, one spectrum at a time.
+
+Every stage is a generator that takes an iterable of `Spectrum` records and
+yields new ones, so only a spectrum (or a small block in the sinks) is held
+in memory whatever the size of the run. Stages are composed by nesting:
+
+    spectra = read_spectra("raw")                     # or follow=True
+    spectra = subtract_reference(spectra)
+    spectra = select_window(spectra, (1000, 1800))
+    spectra = correct_baseline(spectra, "asls")
+    write_to_store(spectra, "bkg_subtracted_store")   # or write_csv_files
+
+With `read_spectra(..., follow=True)` the same pipeline keeps running on a
+folder that is still being filled by run_series.
+"""
+import os
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from baselines import BatchBaseline
+from file_watch import FileWaitTimeout, wait_for_files
+from series_store import append_to_store, write_store
+from spectra_processing import list_series_files, read_spectrum
+
+Spectrum = namedtuple("Spectrum", ["name", "x", "y", "metadata"])
+# stems of the files run_series writes, one number per spectrum
+SERIES_NAME = re.compile(r"\d+")
+
+
+def read_spectra(folder, extension=".csv", follow=False, poll=1.0, idle_timeout=None, settle=0.2,
+                 file_timeout=30.0):
+    """
+    Yield the spectra of `folder` in sorted order.
+
+    With `follow=True` new files are yielded as they appear (once they are
+    completely written) until no file has arrived for `idle_timeout`
+    seconds; None follows forever (stop with Ctrl+C or by closing the
+    generator). Only series files are followed (numbered like run_series
+    names them, "12.csv"), not the processing.csv Omnic is still writing.
+    Only files modified within the last `settle` seconds are waited for.
+    A file that is not complete after `file_timeout` seconds, that
+    disappears or that is still locked is skipped and tried again on the
+    next poll if it is back.
+    """
+    seen = set()
+    last_new = time.monotonic()
+    while True:
+        new_files = [file for file in list_series_files(folder, extension)
+                     if file not in seen and (not follow or SERIES_NAME.fullmatch(os.path.splitext(file)[0]))]
+        arrived = False
+        for file in new_files:
+            path = os.path.join(folder, file)
+            try:
+                # files that stopped changing more than `settle` ago (all of
+                # them when catching up with a filled folder) are read at once
+                if follow and time.time() - os.path.getmtime(path) < settle:
+                    wait_for_files([path], timeout=file_timeout, settle=settle)
+                x, y = read_spectrum(path)
+                mtime = os.path.getmtime(path)
+            except (FileWaitTimeout, FileNotFoundError, PermissionError):
+                if not follow:
+                    raise
+                continue
+            seen.add(file)
+            arrived = True
+            yield Spectrum(os.path.splitext(file)[0], x, y, {"mtime": mtime})
+        if not follow:
+            return
+        now = time.monotonic()
+        if arrived:
+            last_new = now
+        elif idle_timeout is not None and now - last_new > idle_timeout:
+            return
+        time.sleep(poll)
+
+
+def subtract_reference(spectra, reference=None):
+    """Subtract `reference` (y array), by default the first spectrum, from every spectrum."""
+    for spectrum in spectra:
+        if reference is None:
+            reference = spectrum.y
+        if spectrum.y.size != reference.size:
+            raise ValueError(f"{spectrum.name} has {spectrum.y.size} points, the reference {reference.size}")
+        yield spectrum._replace(y=spectrum.y - reference)
+
+
+def select_window(spectra, wave_range):
+    """Keep the points with wave_range[0] < x < wave_range[1], like columns_selection."""
+    x_seen, window = None, None
+    for spectrum in spectra:
+        # the window only changes when the axis does
+        if x_seen is None or not np.array_equal(spectrum.x, x_seen):
+            x_seen = spectrum.x
+            window = (x_seen > wave_range[0]) & (x_seen < wave_range[1])
+            x_window = x_seen[window]
+        yield spectrum._replace(x=x_window, y=spectrum.y[window])
+
+
+def correct_baseline(spectra, fitter, **params):
+    """Subtract a baseline; the fitter is set up once per wave number axis."""
+    x_seen, baseline_fitter = None, None
+    for spectrum in spectra:
+        if x_seen is None or not np.array_equal(spectrum.x, x_seen):
+            x_seen = spectrum.x
+            baseline_fitter = BatchBaseline(x_seen, fitter, **params)
+        _, corrected, info = baseline_fitter.fit(spectrum.y)
+        metadata = {**spectrum.metadata, "iterations": int(info["iterations"].iloc[0])}
+        yield spectrum._replace(y=corrected, metadata=metadata)
+
+
+def write_to_store(spectra, path, block=64):
+    """
+    Sink: write the spectra to a series store, `block` spectra at a time.
+
+    Returns the number of spectra written. The store is readable (with the
+    spectra written so far) while the pipeline runs.
+    """
+    count = 0
+    names, columns, mtimes = [], [], []
+    x = None
+
+    def flush():
+        intensities = np.column_stack(columns)
+        if count == len(names):
+            write_store(path, x, names, intensities, {"mtime": list(mtimes)})
+        else:
+            append_to_store(path, names, intensities, {"mtime": list(mtimes)})
+        names.clear()
+        columns.clear()
+        mtimes.clear()
+
+    for spectrum in spectra:
+        if x is None:
+            x = spectrum.x
+        elif spectrum.x.size != x.size:
+            raise ValueError(f"{spectrum.name} has {spectrum.x.size} points, the store {x.size}")
+        names.append(spectrum.name)
+        columns.append(spectrum.y)
+        mtimes.append(spectrum.metadata.get("mtime"))
+        count += 1
+        if len(names) >= block:
+            flush()
+    if names:
+        flush()
+    return count
+
+
+def write_csv_files(spectra, folder):
+    """Sink: write every spectrum to folder/<name>.csv in the two-column Omnic format."""
+    os.makedirs(folder, exist_ok=True)
+    count = 0
+    for spectrum in spectra:
+        np.savetxt(os.path.join(folder, spectrum.name + ".csv"),
+                   np.column_stack([spectrum.x, spectrum.y]), delimiter=",", fmt="%.10g")
+        count += 1
+    return count
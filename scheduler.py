@@ -0,0 +1,83 @@
+"""
+Fixed-grid scheduling for run_series.
+
+Collections are planned on a grid start + k * interval of a monotonic clock
+(time.perf_counter, which unlike time.time does not jump with clock changes
+and, unlike time.monotonic, has sub-millisecond resolution on Windows). A
+slow collection never moves the grid, it only decides how the series gets
+back onto it:
+
+    "compress"  collection i keeps slot i; late collections start right
+                away, one after the other, until the series is back on time
+    "skip"      slots that have already passed (by more than `tolerance`)
+                are dropped and the next collection waits for the next free
+                slot, so collections always start on the grid (the series
+                ends later)
+"""
+import time
+
+POLICIES = ("compress", "skip")
+
+clock = time.perf_counter
+
+
+class SlotScheduler:
+    """
+    Parameters
+    ----------
+    interval : float
+        Seconds between grid slots.
+    policy : str
+        "compress" or "skip", see the module docstring.
+    tolerance : float | None
+        How late a slot may still be used with the "skip" policy, default a
+        tenth of the interval.
+
+    Attributes
+    ----------
+    origin : float | None
+        Clock time of slot 0, set by start().
+    slot : int
+        Slot of the collection that was last scheduled.
+    skipped : int
+        Slots dropped so far ("skip" policy).
+    """
+
+    def __init__(self, interval, policy="compress", tolerance=None):
+        if interval < 0:
+            raise ValueError("interval must not be negative")
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.interval = interval
+        self.policy = policy
+        self.tolerance = 0.1 * interval if tolerance is None else tolerance
+        self.origin = None
+        self.slot = -1
+        self.skipped = 0
+
+    def start(self, now=None):
+        self.origin = clock() if now is None else now
+        self.slot = -1
+        self.skipped = 0
+
+    def slot_time(self, slot):
+        return self.origin + slot * self.interval
+
+    def next_slot(self, now=None):
+        """Pick the slot of the next collection and return its clock time."""
+        if self.origin is None:
+            self.start(now)
+        now = clock() if now is None else now
+        slot = self.slot + 1
+        late = now - self.slot_time(slot)
+        if self.policy == "skip" and self.interval > 0 and late > self.tolerance:
+            # first slot that can still start within the tolerance
+            missed = int((late - self.tolerance) // self.interval) + 1
+            slot += missed
+            self.skipped += missed
+        self.slot = slot
+        return self.slot_time(slot)
+
+    def finish_time(self, remaining):
+        """Clock time at which the last of `remaining` more collections is due."""
+        return self.slot_time(self.slot + remaining)
@@ -0,0 +1,177 @@
+"""
+Binary store for a combined series of spectra.
+
+A store is a folder with two files:
+
+    data.bin    the matrix in column-major order, column 0 is the wave number
+                axis and every following column is one spectrum
+    meta.json   shape, dtype, column names and acquisition metadata
+
+Opening a store maps data.bin with np.memmap, so nothing is parsed and
+slices of the wave number axis or of the spectra are views on the file.
+
+A store can be written as float32 to halve its size. The wave number axis
+then loses digits in column 0, so it is also kept at full precision in
+
+    wavenumber.bin  float64 axis, only when data.bin is narrower
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DATA_FILE = "data.bin"
+META_FILE = "meta.json"
+AXIS_FILE = "wavenumber.bin"
+
+
+class SeriesStore:
+    """
+    Memory-mapped view of a store written by `write_store`.
+
+    Attributes
+    ----------
+    data : np.memmap, shape (n_points, n_spectra + 1)
+        Whole matrix, column 0 is the wave number.
+    columns : list[str]
+        Names of the spectra (file names without extension).
+    metadata : dict
+        Acquisition metadata saved with the store.
+    """
+
+    def __init__(self, path, mode="r"):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        self.columns = list(meta["columns"])
+        self.metadata = meta.get("metadata", {})
+        self.dtype = np.dtype(meta["dtype"])
+        shape = (meta["n_points"], len(self.columns) + 1)
+        self.data = np.memmap(os.path.join(path, DATA_FILE), dtype=self.dtype,
+                              mode=mode, shape=shape, order="F")
+        self._axis = None
+        if meta.get("axis_dtype"):
+            self._axis = np.memmap(os.path.join(path, AXIS_FILE), dtype=meta["axis_dtype"],
+                                   mode="r", shape=(shape[0],))
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __repr__(self):
+        return f"SeriesStore({self.path!r}, {self.data.shape[0]} points x {len(self)} spectra)"
+
+    @property
+    def wavenumber(self):
+        return self.data[:, 0] if self._axis is None else self._axis
+
+    @property
+    def intensities(self):
+        return self.data[:, 1:]
+
+    def to_dataframe(self):
+        # One block wrapping the memmap, the DataFrame holds no copy of the
+        # data; the axis comes from self.wavenumber, exact in float32 stores
+        df = pd.DataFrame(self.intensities, columns=self.columns, copy=False)
+        df.insert(0, "Wave number", pd.Series(self.wavenumber, index=df.index, copy=False))
+        return df
+
+    def to_csv(self, csv_path):
+        self.to_dataframe().to_csv(csv_path, index=False)
+
+
+def write_store(path, wavenumber, names, intensities, metadata=None, dtype=None):
+    """
+    Write a wave number axis and an intensity matrix to a store folder.
+
+    Parameters
+    ----------
+    path : str
+        Store folder, created if needed. An existing store is overwritten.
+    wavenumber : array-like, shape (n_points,)
+    names : list[str]
+        One name per spectrum.
+    intensities : array-like, shape (n_points, n_spectra)
+    metadata : dict | None
+        JSON-serialisable acquisition metadata.
+    dtype : np.dtype | str | None
+        dtype of data.bin, e.g. "float32"; by default the wider of the two
+        inputs.
+
+    Returns
+    -------
+    SeriesStore
+        The store opened read-only.
+    """
+    wavenumber = np.asarray(wavenumber)
+    intensities = np.asarray(intensities)
+    if intensities.ndim != 2 or intensities.shape != (wavenumber.size, len(names)):
+        raise ValueError(f"intensities must have shape ({wavenumber.size}, {len(names)}), "
+                         f"got {intensities.shape}")
+
+    os.makedirs(path, exist_ok=True)
+    dtype = np.result_type(wavenumber.dtype, intensities.dtype) if dtype is None else np.dtype(dtype)
+    data = np.memmap(os.path.join(path, DATA_FILE), dtype=dtype, mode="w+",
+                     shape=(wavenumber.size, len(names) + 1), order="F")
+    data[:, 0] = wavenumber
+    data[:, 1:] = intensities
+    data.flush()
+    del data
+
+    # keep the axis exact when data.bin cannot hold it
+    axis_dtype = None
+    if np.result_type(wavenumber.dtype, dtype) != dtype:
+        axis_dtype = wavenumber.dtype.str
+        wavenumber.tofile(os.path.join(path, AXIS_FILE))
+    elif os.path.exists(os.path.join(path, AXIS_FILE)):
+        os.remove(os.path.join(path, AXIS_FILE))
+
+    _write_meta(path, {
+        "n_points": int(wavenumber.size),
+        "dtype": dtype.str,
+        "axis_dtype": axis_dtype,
+        "columns": [str(name) for name in names],
+        "metadata": metadata or {},
+    })
+    return SeriesStore(path)
+
+
+def append_to_store(path, names, intensities, metadata=None):
+    """
+    Append spectra to an existing store without rewriting it.
+
+    The matrix is column-major, so new spectra are simply added at the end of
+    data.bin. Lists in `metadata` extend the stored lists, other values
+    replace them.
+    """
+    with open(os.path.join(path, META_FILE), "r") as f:
+        meta = json.load(f)
+    intensities = np.asarray(intensities, dtype=meta["dtype"])
+    if intensities.ndim != 2 or intensities.shape != (meta["n_points"], len(names)):
+        raise ValueError(f"intensities must have shape ({meta['n_points']}, {len(names)}), "
+                         f"got {intensities.shape}")
+
+    with open(os.path.join(path, DATA_FILE), "ab") as f:
+        # the transpose of a column-major block is row-major, tofile writes it as is
+        np.ascontiguousarray(intensities.T).tofile(f)
+
+    meta["columns"] += [str(name) for name in names]
+    for key, value in (metadata or {}).items():
+        if isinstance(value, list) and isinstance(meta["metadata"].get(key), list):
+            meta["metadata"][key] += value
+        else:
+            meta["metadata"][key] = value
+    _write_meta(path, meta)
+    return SeriesStore(path)
+
+
+def open_store(path, mode="r"):
+    return SeriesStore(path, mode=mode)
+
+
+def _write_meta(path, meta):
+    # Write next to the old file and swap, a reader never sees half a file
+    tmp_path = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
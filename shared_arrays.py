@@ -0,0 +1,67 @@
+"""
+Float64 matrices shared with the workers of a process pool.
+
+The parent puts the data in a shared memory block laid out like a series
+store (column-major, column 0 the wave number axis) and hands the pool
+initializer only the block's name; every worker attaches to it once, so no
+DataFrame or matrix is pickled. fit_baselines_parallel and
+fast_plot.render_batch both work this way:
+
+    with shared_series(x, Y) as (name, shape):
+        with ProcessPoolExecutor(initializer=_init_worker, initargs=(name, shape)) as executor:
+            ...
+
+    def _init_worker(name, shape):
+        shm, data = attach_matrix(name, shape)    # keep shm with data
+
+A block is unlinked when its `with` ends, also on errors.
+"""
+import contextlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _as_matrix(shm, shape):
+    return np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order="F")
+
+
+@contextlib.contextmanager
+def shared_matrix(shape):
+    """
+    A new shared (n_rows, n_cols) float64 matrix, column-major.
+
+    Yields (name, array). Copy out what must outlive the block.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=8 * max(int(np.prod(shape)), 1))
+    try:
+        yield shm.name, _as_matrix(shm, shape)
+    finally:
+        shm.unlink()
+        try:
+            shm.close()
+        except BufferError:
+            # an array on the block is still referenced (by the caller or a
+            # traceback); the mapping is released together with it
+            pass
+
+
+@contextlib.contextmanager
+def shared_series(x, Y):
+    """Shared copy of a series, x in column 0 and Y after it. Yields (name, shape)."""
+    shape = (len(x), Y.shape[1] + 1)
+    with shared_matrix(shape) as (name, data):
+        data[:, 0] = x
+        data[:, 1:] = Y
+        del data
+        yield name, shape
+
+
+def attach_matrix(name, shape):
+    """
+    (shm, array) of a block made in the parent, for a pool worker.
+
+    The array is only valid while `shm` is referenced; keep both.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, _as_matrix(shm, shape)
@@ -0,0 +1,111 @@
+"""
+A pretend spectrometer for running spa_series without Omnic.
+
+`SimulatedSpectrometer` is an omnic backend (see omnic.py). When asked to
+run collect.mac it reads the sample name and the exports from the macro,
+waits `delay` (+ uniform jitter) seconds on a timer thread, like a real
+collection, and then writes processing.csv (if the macro exports it) and
+processing.spa next to the macro with a synthetic spectrum. Like Omnic,
+RunMacro returns immediately.
+
+    from simulated_omnic import simulated_controller
+    run_series(interval=2, count=10, controller=simulated_controller(delay=1.0))
+"""
+import datetime
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from omnic import AcquisitionController, FakeOmnicBackend
+from spa_reader import write_spa
+
+_SAMPLE_RE = re.compile(rb'CollectSample ""spectrum_(.*?)""')
+
+
+class SimulatedSpectrometer(FakeOmnicBackend):
+    """
+    Parameters
+    ----------
+    delay : float
+        Collection time in seconds.
+    jitter : float
+        Up to this many seconds are added to every collection at random.
+    n_points : int
+        Points per spectrum, evenly spaced from 4000 to 650 cm-1.
+    seed : int
+        Seed of the noise and of the jitter.
+
+    Attributes
+    ----------
+    collections : list[dict]
+        Per macro run: sample name, "requested" (perf_counter time of
+        RunMacro), "delay" (the simulated collection time) and "written"
+        (perf_counter time once both files are written).
+    """
+
+    def __init__(self, delay=1.0, jitter=0.0, n_points=1000, seed=0):
+        super().__init__()
+        self.delay = delay
+        self.jitter = jitter
+        self.n_points = n_points
+        self.collections = []
+        self._rng = np.random.default_rng(seed)
+        self._x = np.linspace(4000, 650, n_points)
+        self._lock = threading.Lock()
+        self._busy = threading.Event()
+        self._busy.set()
+
+    def run_macro(self, path):
+        with open(path, "rb") as f:
+            macro = f.read()
+        match = _SAMPLE_RE.search(macro)
+        collection = {
+            "sample": match.group(1).decode("cp1252") if match else "",
+            "requested": time.perf_counter(),
+            "delay": self.delay + (self._rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0),
+        }
+        self.collections.append(collection)
+        export_csv = b"processing.csv" in macro
+        self._busy.clear()
+        timer = threading.Timer(collection["delay"], self._write,
+                                args=(os.path.dirname(path), collection, export_csv))
+        timer.daemon = True
+        timer.start()
+
+    def spectrum(self, index):
+        # A band at 1650 cm-1 growing along the series, a sloped baseline and noise
+        with self._lock:
+            noise = self._rng.normal(0, 1e-4, self.n_points)
+        x = self._x
+        return 0.05 * np.exp(-((x - 1650) / 30) ** 2) * (1 - np.exp(-index / 50)) \
+            + 1e-5 * (x - 650) + noise
+
+    def _write(self, folder, collection, export_csv):
+        try:
+            index = int(collection["sample"])
+        except ValueError:
+            index = len(self.collections) - 1
+        y = self.spectrum(index)
+        if export_csv:
+            with open(os.path.join(folder, "processing.csv"), "w", newline="\r\n") as f:
+                f.write("\n".join(f"{a:.6f},{b:.6e}" for a, b in zip(self._x, y)))
+                f.write("\n")
+        write_spa(os.path.join(folder, "processing.spa"), self._x, y,
+                  title=f"spectrum_{collection['sample']}",
+                  timestamp=datetime.datetime.now(datetime.timezone.utc))
+        collection["written"] = time.perf_counter()
+        self._busy.set()
+
+    def wait_idle(self, timeout=None):
+        """Block until the running collection (if any) has written its files."""
+        return self._busy.wait(timeout)
+
+
+def simulated_controller(delay=1.0, jitter=0.0, n_points=1000, seed=0, export_csv=True,
+                         macro_path="collect.mac"):
+    """An AcquisitionController driving a SimulatedSpectrometer."""
+    backend = SimulatedSpectrometer(delay=delay, jitter=jitter, n_points=n_points, seed=seed)
+    return AcquisitionController(backend, export_csv=export_csv, macro_path=macro_path)
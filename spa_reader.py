@@ -0,0 +1,188 @@
+"""
+Reader for Thermo Omnic .spa files.
+
+Layout of the parts we use (all little-endian):
+
+    0       "Spectral Data File", checked before anything else is read
+    30      title, 256 bytes, NUL-terminated
+    294     uint16 number of directory entries
+    296     uint32 acquisition time, seconds since 1899-12-31 00:00 UTC
+    304     directory, one 16 byte entry per section:
+                +0 uint8 key, +2 uint32 offset, +6 uint32 size
+            all entries are read (keys we do not use are skipped); without a
+            usable count the directory ends at the first key 0 or 1 after the
+            first entry
+
+Sections:
+
+    key 2   spectrum header: +4 uint32 number of points, +8 uint8 x units,
+            +12 uint8 y units, +16 float32 first x, +20 float32 last x,
+            +36 uint32 number of scans
+    key 3   intensities, float32
+    key 27  collection history text
+
+The whole file is read once and every field comes out of it with
+np.frombuffer, the intensity block included.
+"""
+import datetime
+
+import numpy as np
+
+EPOCH = datetime.datetime(1899, 12, 31, tzinfo=datetime.timezone.utc)
+MAGIC = b"Spectral Data File"
+# what follows MAGIC in the files write_spa makes
+MAGIC_END = b"\r\n\x1a"
+
+TITLE_OFFSET = 30
+TITLE_SIZE = 256
+N_KEYS_OFFSET = 294
+TIMESTAMP_OFFSET = 296
+DIRECTORY_OFFSET = 304
+ENTRY_SIZE = 16
+
+KEY_HEADER = 2
+KEY_DATA = 3
+KEY_HISTORY = 27
+
+X_UNITS = {1: "cm-1"}
+Y_UNITS = {11: "reflectance", 12: "log(1/R)", 16: "transmittance", 17: "absorbance",
+           20: "Kubelka-Munk"}
+
+
+def _scalar(buffer, dtype, offset):
+    return np.frombuffer(buffer, dtype=dtype, count=1, offset=offset)[0].item()
+
+
+def _check_magic(buffer, file_path):
+    if not buffer.startswith(MAGIC):
+        raise ValueError(f"{file_path} is not a .spa file (no '{MAGIC.decode()}' signature)")
+
+
+def _sections(buffer):
+    n_entries = _scalar(buffer, "<u2", N_KEYS_OFFSET) if len(buffer) >= N_KEYS_OFFSET + 2 else 0
+    end = DIRECTORY_OFFSET + n_entries * ENTRY_SIZE
+    counted = 0 < n_entries and end <= len(buffer)
+    if not counted:
+        end = len(buffer) - len(buffer) % ENTRY_SIZE
+    sections = {}
+    for pos in range(DIRECTORY_OFFSET, end - ENTRY_SIZE + 1, ENTRY_SIZE):
+        key = buffer[pos]
+        if key in (0, 1):
+            # the first entry may be an empty or self-describing one
+            if counted or pos == DIRECTORY_OFFSET:
+                continue
+            break
+        # keep the first occurrence, later ones are copies made by Omnic
+        sections.setdefault(key, (_scalar(buffer, "<u4", pos + 2), _scalar(buffer, "<u4", pos + 6)))
+    return sections
+
+
+def read_spa(file_path):
+    """
+    Read a Thermo .spa spectrum.
+
+    Returns
+    -------
+    wavenumber : np.ndarray, shape (n_points,)
+        x axis, in the order stored in the file (usually decreasing).
+    intensities : np.ndarray, shape (n_points,)
+        float64 copy of the float32 intensities.
+    metadata : dict
+        'title', 'timestamp' (timezone-aware datetime or None), 'x_units',
+        'y_units', 'n_scans' and 'history'.
+    """
+    with open(file_path, "rb") as f:
+        buffer = f.read()
+    _check_magic(buffer, file_path)
+
+    sections = _sections(buffer)
+    if KEY_HEADER not in sections or KEY_DATA not in sections:
+        raise ValueError(f"{file_path} is not a readable .spa file (missing header or data section)")
+
+    header = sections[KEY_HEADER][0]
+    n_points = _scalar(buffer, "<u4", header + 4)
+    first_x = _scalar(buffer, "<f4", header + 16)
+    last_x = _scalar(buffer, "<f4", header + 20)
+
+    data_offset, data_size = sections[KEY_DATA]
+    if data_size // 4 < n_points or data_offset + 4 * n_points > len(buffer):
+        raise ValueError(f"{file_path} is truncated: {n_points} points announced")
+    intensities = np.frombuffer(buffer, dtype="<f4", count=n_points, offset=data_offset)
+    wavenumber = np.linspace(first_x, last_x, n_points)
+
+    title = buffer[TITLE_OFFSET:TITLE_OFFSET + TITLE_SIZE].split(b"\x00", 1)[0]
+    seconds = _scalar(buffer, "<u4", TIMESTAMP_OFFSET)
+    history = ""
+    if KEY_HISTORY in sections:
+        offset, size = sections[KEY_HISTORY]
+        history = buffer[offset:offset + size].split(b"\x00", 1)[0].decode("latin-1")
+
+    metadata = {
+        "title": title.decode("latin-1"),
+        "timestamp": EPOCH + datetime.timedelta(seconds=seconds) if seconds else None,
+        "x_units": X_UNITS.get(buffer[header + 8], buffer[header + 8]),
+        "y_units": Y_UNITS.get(buffer[header + 12], buffer[header + 12]),
+        "n_scans": _scalar(buffer, "<u4", header + 36),
+        "history": history,
+    }
+    return wavenumber, intensities.astype(np.float64), metadata
+
+
+def read_spa_timestamp(file_path):
+    # Only the fixed-size part of the header, for listing many files quickly
+    with open(file_path, "rb") as f:
+        buffer = f.read(TIMESTAMP_OFFSET + 4)
+    _check_magic(buffer, file_path)
+    seconds = _scalar(buffer, "<u4", TIMESTAMP_OFFSET)
+    return EPOCH + datetime.timedelta(seconds=seconds) if seconds else None
+
+
+def write_spa(file_path, wavenumber, intensities, title="", timestamp=None, history=""):
+    """
+    Write a minimal .spa file with the layout `read_spa` understands.
+
+    Only meant for synthetic data (simulated instrument, benchmarks); the
+    wave number axis is stored as its first and last value, so it must be
+    evenly spaced like the ones Omnic writes.
+    """
+    wavenumber = np.asarray(wavenumber, dtype=np.float64)
+    intensities = np.asarray(intensities, dtype="<f4")
+    if timestamp is None:
+        timestamp = datetime.datetime.now(datetime.timezone.utc)
+    elif timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+
+    header_offset = 560
+    header_size = 200
+    history_bytes = history.encode("latin-1") + b"\x00"
+    data_offset = header_offset + header_size
+    history_offset = data_offset + intensities.nbytes
+
+    buffer = bytearray(history_offset + len(history_bytes))
+    buffer[:len(MAGIC) + len(MAGIC_END)] = MAGIC + MAGIC_END
+    buffer[TITLE_OFFSET:TITLE_OFFSET + TITLE_SIZE - 1] = \
+        title.encode("latin-1")[:TITLE_SIZE - 1].ljust(TITLE_SIZE - 1, b"\x00")
+    entries = [(KEY_HEADER, header_offset, header_size),
+               (KEY_DATA, data_offset, intensities.nbytes),
+               (KEY_HISTORY, history_offset, len(history_bytes))]
+    np.frombuffer(buffer, "<u2", 1, N_KEYS_OFFSET)[:] = len(entries) + 1
+    np.frombuffer(buffer, "<u4", 1, TIMESTAMP_OFFSET)[:] = \
+        int((timestamp - EPOCH).total_seconds())
+
+    for idx, (key, offset, size) in enumerate(entries, start=1):
+        pos = DIRECTORY_OFFSET + idx * ENTRY_SIZE
+        buffer[pos] = key
+        np.frombuffer(buffer, "<u4", 1, pos + 2)[:] = offset
+        np.frombuffer(buffer, "<u4", 1, pos + 6)[:] = size
+
+    np.frombuffer(buffer, "<u4", 1, header_offset + 4)[:] = intensities.size
+    buffer[header_offset + 8] = 1   # cm-1
+    buffer[header_offset + 12] = 17  # absorbance
+    np.frombuffer(buffer, "<f4", 2, header_offset + 16)[:] = (wavenumber[0], wavenumber[-1])
+    np.frombuffer(buffer, "<u4", 1, header_offset + 36)[:] = 1
+
+    buffer[data_offset:history_offset] = intensities.tobytes()
+    buffer[history_offset:] = history_bytes
+
+    with open(file_path, "wb") as f:
+        f.write(buffer)
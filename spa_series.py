@@ -1,78 +1,34 @@
+import argparse
+import json
 import os
 import glob
-import win32com.client
-import win32api
 import time
+import warnings
 
-def generate_macro(sample_name: str):
-    content = f"""OmnicMacroFile Version 10.0,
-caption,Macros\\Basic - collect.mac
->pName,collect.mac
->pComments,
->pAuthor,Haochen Zhang
->pReset,true
->pFormat,?
-§
-send updateReadout "Open Experiment", 1
-send executeOmnic "[LoadParameters " & getRTSFN("C:\\my documents\\omnic\\Param\\Haochen_Default.exp") & "]"
-send updateReadout "Collect Sample", 2
-send enableApp false
-send executeOmnic "[Invoke CollectSample ""spectrum_{sample_name}"" AUTO POLLING]"
-send waitOnInvoke "CollectSample"
-send updateReadout "Save As", 3
-send executeOmnic "[Export " & getRTSFN("processing.csv") & "]"
-send updateReadout "Save As", 4
-send executeOmnic "[Export " & getRTSFN("processing.spa") & "]"
-sysError = "ok"
-send updateReadout
-§
-false
-§
-Button,Open Experiment
-strokeColor,240,50,100
->pTaskType,3
->pAlias,LoadParameters
->pParamList,"C:\\my documents\\omnic\\Param\\Haochen_Default.exp",false,1,1,1,1
-¡endTask!
-Button,Collect Sample
-strokeColor,240,50,100
->pTaskType,3
->pAlias,CollectSample
->pParamList,"spectrum_{sample_name}",true,false,false
-¡endTask!
-Button,Save As
-strokeColor,240,50,100
->pTaskType,3
->pAlias,SaveAs
->pParamList,"processing.csv",false
-¡endTask!
-Button,Save As
-strokeColor,240,50,100
->pTaskType,3
->pAlias,SaveAs
->pParamList,"processing.spa",false
-¡endTask!
-§
-"""
-    with open("collect.mac", "w", encoding="ansi") as f:
-        f.write(content)
+from file_watch import FileWaitTimeout, wait_for_files
+from omnic import AcquisitionController
+from scheduler import POLICIES, SlotScheduler, clock
 
+def generate_macro(sample_name: str, export_csv: bool = True):
+    # Deprecated alias kept for old scripts; run_series writes the macro
+    # through its AcquisitionController
+    warnings.warn("generate_macro is deprecated, use omnic.AcquisitionController.write_macro",
+                  DeprecationWarning, stacklevel=2)
+    AcquisitionController(export_csv=export_csv).write_macro(sample_name)
     print(f"Macro file “collect.mac” generated with sample name: spectrum_{sample_name}")
 
-
 def run_omnic_macro():
-    try:
-        # Connect to Omnic using the correct COM interface
-        OmApp = win32com.client.Dispatch("OmnicApp.OmnicApp")
-        collect_path = os.path.abspath("collect.mac")
-        short_path = win32api.GetShortPathName(collect_path)
-        # print(short_path)
-        OmApp.ExecuteCommand(f"RunMacro {short_path}")
-        # print("Collecting the spectrum...")
-        return True
-    except Exception as e:
-        print(f"ERROR running macro: {e}")
-        return False
+    # Deprecated alias kept for old scripts: one COM session per call, the
+    # AcquisitionController of run_series keeps its session for the series
+    warnings.warn("run_omnic_macro is deprecated, use omnic.AcquisitionController.dispatch",
+                  DeprecationWarning, stacklevel=2)
+    with AcquisitionController() as controller:
+        try:
+            controller.dispatch()
+            return True
+        except Exception as e:
+            print(f"ERROR running macro: {e}")
+            return False
 
 def rename_spa(i):
     # Get all .SPA files in the current directory
@@ -116,12 +72,17 @@ def rename_csv(i):
     except Exception as e:
         print(f"ERROR processing {csv_files}: {e}")
 
-def countdown(total_seconds: int):
-    while total_seconds >= 0:
-        mins, secs = divmod(total_seconds, 60)
+def wait_until(deadline):
+    # Show a countdown while waiting for `deadline` (scheduler clock); the
+    # last sleep ends exactly on it rather than on a whole second
+    remaining = deadline - clock()
+    while remaining > 1:
+        mins, secs = divmod(int(remaining), 60)
         print(f"Waiting {mins:02}:{secs:02} for next collection...", end="\r", flush=True)
-        time.sleep(1)
-        total_seconds -= 1
+        time.sleep(remaining - int(remaining) or 1)
+        remaining = deadline - clock()
+    if remaining > 0:
+        time.sleep(remaining)
     print(" " * 62, end="\r", flush=True)
 
 def time_formatting(total_seconds):
@@ -129,12 +90,31 @@ def time_formatting(total_seconds):
         mins, secs = divmod(remainder, 60)
         return (hrs,mins,secs)
 
-def run_series():
+def run_series(export_csv=True, collect_timeout=None, settle=0.2, processor=None, controller=None,
+               interval=None, count=None, policy="compress", telemetry="series_telemetry.jsonl"):
+    # interval, count: seconds between collections and number of spectra;
+    # asked for interactively when not given
+    # collect_timeout: seconds to wait for the output files of one collection
+    # before giving up; settle: how long they must stay unchanged (file_watch.py)
+    # processor: a live_processing.LiveProcessor that gets every new .spa file,
+    # so the data is processed during the waiting time between collections
+    # controller: an omnic.AcquisitionController, e.g. with a fake backend;
+    # by default one COM session to Omnic is opened for the whole series
+    # policy: how to get back on the schedule after a slow collection,
+    # "compress" or "skip" (scheduler.py)
+    # telemetry: JSONL file with the timing of every cycle, None to disable
+    if controller is None:
+        controller = AcquisitionController(export_csv=export_csv)
+    log = None
     try:
         #print("Must run within a folder containing collect.mac")
         # Get user input
-        interval_seconds = float(input("Enter the interval between each collection in seconds: "))
-        times = int(input("Enter how many spectra to acquire in total: "))
+        if interval is None:
+            interval = input("Enter the interval between each collection in seconds: ")
+        interval_seconds = float(interval)
+        if count is None:
+            count = input("Enter how many spectra to acquire in total: ")
+        times = int(count)
 
         # Validate input
         #if interval_seconds < 60:
@@ -143,6 +123,7 @@ def run_series():
         if times <= 0:
             print("ERROR: Number of times must be greater than 0")
             return
+        scheduler = SlotScheduler(interval_seconds, policy)
 
         # Convert interval seconds to mins+secs
         hrs, mins, secs = time_formatting(interval_seconds)
@@ -155,56 +136,99 @@ def run_series():
         print(f"Estimated total time: {thrs} hours {tmins} minutes {tsecs} seconds")
         print("-" * 68)
 
-        next_start_time = time.time()
+        if telemetry is not None:
+            log = open(telemetry, "a")
+        scheduler.start()
+        stopped = False
         # Run the function the specified number of times
         for i in range(times):
-            # Double confirm that the start time
-            now = time.time()
-            if now < next_start_time:
-                time.sleep(next_start_time - now)
+            # Wait for the slot of this collection on the fixed grid
+            slot_time = scheduler.next_slot()
+            wait_until(slot_time)
+            cycle_start = clock()
 
             print(f"\nCollection {i + 1}/{times}:")
 
-            #generate the macro file with order name
-            generate_macro("%04d" %i)
-
-            run_omnic_macro()
-
-            # Wait until file output processing.spa is detected (macro finish)
-            while True:
-                for dots in range(4):  # 0 to 3 dots, check the existence of processing.spa every 2s
-                    print(f"Collecting the spectrum{'.' * dots}   ", end="\r", flush=True)
-                    time.sleep(0.66666667)
-                # time.sleep(2)
-                if os.path.exists("processing.spa"):
-                    print(f"Output file processing.spa detected,the collection has finished")
-                    time.sleep(1) #just to be safe that all the files are generated.
-                    rename_spa(i)
+            #write the macro file with order name and start it in Omnic
+            ok = controller.collect("%04d" %i)
+            dispatched = clock()
+
+            detection = {}
+            error = None if ok else "dispatch"
+            if ok:
+                # Wait until every output file of the macro is completely written
+                # (exists, stopped growing, not locked by Omnic any more)
+                print("Collecting the spectrum...", end="\r", flush=True)
+                try:
+                    wait_for_files(controller.outputs, timeout=collect_timeout, settle=settle, info=detection)
+                except FileWaitTimeout as e:
+                    error = "timeout"
+                    # Omnic may still be busy; files arriving late would be
+                    # taken for the next collection, so the series stops here
+                    print(f"\nERROR: Collection {i + 1} did not finish in time ({e}), stopping the series")
+            if error is None:
+                detected = clock()
+                print("Output files detected, the collection has finished")
+                rename_spa(i)
+                if controller.export_csv:
                     rename_csv(i)
-                    break
+                renamed = clock()
+                if processor is not None:
+                    processor.submit("%04d.spa" % i)
+            elif error == "dispatch":
+                # Omnic never started the macro, no output file is coming
+                print("WARNING: The macro could not be started, skipping this collection")
+
+            if log is not None:
+                timing = controller.timings[-1]
+                done = error is None
+                collection = detection.get("appeared", detected - dispatched) if done else None
+                log.write(json.dumps({
+                    "cycle": i,
+                    "slot": scheduler.slot,
+                    "scheduled": slot_time - scheduler.origin,
+                    "lateness": cycle_start - slot_time,
+                    "macro": timing["macro"],
+                    "dispatch": timing["dispatch"],
+                    "reconnects": timing["reconnects"],
+                    "ok": done,
+                    "error": error,
+                    "collection": collection,
+                    "detection": detected - dispatched - collection if done else None,
+                    "rename": renamed - detected if done else None,
+                    "cycle_time": clock() - cycle_start,
+                    "skipped": scheduler.skipped,
+                }) + "\n")
+                log.flush()
+            if error == "timeout":
+                stopped = True
+                break
 
             if i < (times-1): #before the last collection, prepare for the next run after each collection.
-                duration_of_one_run = time.time()-next_start_time
+                now = clock()
+                if now > scheduler.slot_time(scheduler.slot + 1):
+                    if policy == "skip":
+                        print("WARNING: Collection took longer than the interval, skipping to the next free slot")
+                    else:
+                        print("WARNING: Collection took longer than the interval, starting the next one now")
 
                 # Calculate how much time remaining
-                remaining_time=(times-i-1)*interval
+                remaining_time = max(scheduler.finish_time(times-i-1) - now, 0)
                 rhrs, rmins, rsecs = time_formatting(remaining_time)
                 print(f"Estimated remaining time: {rhrs} hours {rmins} minutes {rsecs} seconds")
 
-                if interval_seconds- duration_of_one_run > 0:
-                # Counting down how much time is left by susctracting the time elapsed from time interval
-                # Stop counting at 00:01, so that the time interval is not controlled by the counting down
-                    countdown(int(interval_seconds-duration_of_one_run)-1)
-                else:
-                    print("WARNING: Single collection time is longer than the set interval")
-                    #setting the new interval as the measured time interval:
-                    interval_seconds =  duration_of_one_run
-                    print(f"Time interval now is {round(interval_seconds)} seconds")
-
-                # Schedule next start time based on fixed interval
-                next_start_time += interval_seconds
-
-        print(f"\nCompleted all {times} collections!")
+        if not stopped:
+            print(f"\nCompleted all {times} collections!")
+        if scheduler.skipped:
+            print(f"{scheduler.skipped} slots were skipped")
+        latency = controller.latency_stats()
+        if latency["count"]:
+            print(f"Macro dispatch: median {latency['median']*1000:.1f} ms, max {latency['max']*1000:.1f} ms, "
+                  f"{latency['failures']} failed")
+        if processor is not None:
+            print(f"Finishing processing ({processor.pending()} spectra left)...")
+            processor.close()
+            print(f"Processed {processor.processed} spectra, {len(processor.errors)} errors")
 
     except ValueError:
         print("ERROR: Please enter valid numbers")
@@ -212,7 +236,29 @@ def run_series():
         print("\nExecution interrupted by user")
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        controller.close()
+        if log is not None:
+            log.close()
 
 
 if __name__ == "__main__":
-    run_series()
+    parser = argparse.ArgumentParser(description="Collect a series of spectra with Omnic at fixed intervals.")
+    parser.add_argument("--interval", type=float, help="seconds between collections (asked if not given)")
+    parser.add_argument("--count", type=int, help="number of spectra (asked if not given)")
+    parser.add_argument("--no-csv", action="store_true", help="only export processing.spa")
+    parser.add_argument("--timeout", type=float, help="seconds to wait for one collection's files")
+    parser.add_argument("--policy", choices=POLICIES, default="compress",
+                        help="after a slow collection: start late ones right away (compress) or skip missed slots")
+    parser.add_argument("--telemetry", default="series_telemetry.jsonl", help="per-cycle timing log (JSONL)")
+    parser.add_argument("--simulate", type=float, metavar="DELAY",
+                        help="use the simulated spectrometer with this collection time instead of Omnic")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra collection time when simulating")
+    args = parser.parse_args()
+
+    controller = None
+    if args.simulate is not None:
+        from simulated_omnic import simulated_controller
+        controller = simulated_controller(delay=args.simulate, jitter=args.jitter, export_csv=not args.no_csv)
+    run_series(export_csv=not args.no_csv, collect_timeout=args.timeout, controller=controller,
+               interval=args.interval, count=args.count, policy=args.policy, telemetry=args.telemetry)
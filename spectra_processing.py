@@ -1,105 +1,545 @@
+import hashlib
+import importlib
+import json
 import os
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.ticker import AutoMinorLocator
-from pybaselines import Baseline, utils
 
-def combining_series():
-    # Set the directory containing your CSV files
-
-    #csv_dir = 'path/to/your/csv_files'
-    csv_dir = os.getcwd()+'/raw'
-    output_combined_file = 'combined_raw.csv'
-    output_referenced_file = 'referenced_raw.csv'
-
-    # Get list of all CSV files in the directory
-    csv_files = [f for f in os.listdir(csv_dir) if f.endswith('.csv')]
-    csv_files.sort()  # Optional: ensure consistent order
+from spa_reader import read_spa, read_spa_timestamp
+from series_store import SeriesStore, append_to_store, open_store, write_store
+from grid_alignment import axis_key, get_resampler
+from instrumentation import instrumented
+from windowing import WindowSelector
+
+# matplotlib, pybaselines and scipy are only imported by the functions that
+# need them, so combining a series stays light. The names below used to be
+# imported here and can still be reached as spectra_processing.<name>
+_LAZY_NAMES = {
+    "BatchBaseline": "baselines",
+    "compare_dtype": "baselines",
+    "compare_warm_start": "baselines",
+    "fit_baselines": "baselines",
+    "fit_baselines_parallel": "baselines",
+    "fitter_params": "baselines",
+    "float_dtype": "baselines",
+    "BaselineCache": "baseline_cache",
+    "DEFAULT_CACHE_DIR": "baseline_cache",
+    "render_columns": "fast_plot",
+}
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        return getattr(importlib.import_module(_LAZY_NAMES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+COMBINED_STORE = 'combined_raw_store'
+REFERENCED_STORE = 'referenced_raw_store'
+BKG_SUBTRACTED_STORE = 'bkg_subtracted_store'
+MANIFEST_FILE = 'combined_manifest.json'
+
+# dtype of the intensities everywhere a function is not given one. Set it to
+# np.float32 (compact mode) to halve the memory and the stores of long runs;
+# the wave number axis always stays float64
+DTYPE = np.float64
+
+def _dtype(dtype=None):
+    dtype = np.dtype(DTYPE if dtype is None else dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"dtype must be float32 or float64, not {dtype}")
+    return dtype
+
+def read_omnic_csv(file_path):
+    # Omnic exports two columns (wave number, intensity) without a header, so
+    # numpy's C tokenizer can read them directly without building a DataFrame
+    try:
+        data = np.loadtxt(file_path, delimiter=",", dtype=np.float64, ndmin=2)
+    except ValueError:
+        # fall back to pandas for anything unusual (headers, extra columns...)
+        data = pd.read_csv(file_path, header=None).to_numpy(dtype=np.float64)
+    return data[:, 0], data[:, 1]
+
+@instrumented
+def read_spectrum(file_path):
+    # Dispatch on the extension; .spa files are read straight from the binary
+    if file_path.lower().endswith(".spa"):
+        wavenumber, intensities, _ = read_spa(file_path)
+        return wavenumber, intensities
+    return read_omnic_csv(file_path)
+
+def list_series_files(csv_dir, extension=".csv"):
+    csv_files = [f for f in os.listdir(csv_dir) if f.lower().endswith(extension)]
+    csv_files.sort()
+    return csv_files
+
+def _column_name(file):
+    return os.path.splitext(file)[0]
+
+@instrumented
+def read_series_files(paths, workers=None, n_points=None, grid=None, dtype=None):
+    """
+    Parse `paths` concurrently into a preallocated (n_points, n_files) matrix.
+
+    Returns the wave number axis and the matrix. The axis is `grid` if given,
+    else the one of the first file. Files on another axis (compared by hash,
+    see grid_alignment.py) are interpolated onto it in one batch per distinct
+    axis, with a warning; points outside their range are NaN. With
+    grid="intersection" the axis of the first file is cut down to the points
+    every file covers, so no NaN is left. `n_points` only checks the size of
+    the axis before that cut. The matrix has `dtype` (default DTYPE), files
+    are parsed as float64.
+    """
+    if isinstance(grid, str) and grid != "intersection":
+        raise ValueError(f"grid must be an axis, None or 'intersection', not {grid!r}")
+    intersection = isinstance(grid, str)
+    if workers is None:
+        workers = min(8, os.cpu_count() or 1)
+
+    # The first file (or `grid`) fixes the wave number axis and the matrix shape
+    first_x, first = read_spectrum(paths[0])
+    wavenumber = first_x if grid is None or intersection else np.asarray(grid, dtype=np.float64)
+    if n_points is not None and wavenumber.size != n_points:
+        raise ValueError(f"{paths[0]} has {wavenumber.size} points, expected {n_points}")
+    target_key = axis_key(wavenumber)
+    # Fortran order keeps every spectrum contiguous in memory
+    intensities = np.empty((wavenumber.size, len(paths)), dtype=_dtype(dtype), order="F")
+    # axis key -> (axis, [(column, intensities), ...]) of the files to resample
+    misaligned = {}
+    lock = threading.Lock()
+
+    def place(idx, x, y):
+        key = axis_key(x) if x is not wavenumber else target_key
+        if key == target_key:
+            intensities[:, idx] = y
+            return
+        with lock:
+            misaligned.setdefault(key, (x, []))[1].append((idx, y))
+
+    def fill(idx):
+        x, y = read_spectrum(paths[idx])
+        if y.size != x.size:
+            raise ValueError(f"{paths[idx]} has {y.size} intensities for {x.size} wave numbers")
+        place(idx, x, y)
+
+    place(0, first_x, first)
+    if workers > 1 and len(paths) > 2:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() re-raises the first error from the workers
+            list(executor.map(fill, range(1, len(paths))))
+    else:
+        for idx in range(1, len(paths)):
+            fill(idx)
+
+    if misaligned:
+        resampler = get_resampler(wavenumber)
+        for key, (x, columns) in misaligned.items():
+            cols = [idx for idx, _ in columns]
+            intensities[:, cols] = resampler.resample(x, np.column_stack([y for _, y in columns]), key)
+        n_files = sum(len(columns) for _, columns in misaligned.values())
+        warnings.warn(f"{n_files} of {len(paths)} files are on a different wave number axis "
+                      f"({len(misaligned)} distinct) and were interpolated onto the common one",
+                      stacklevel=3)  # past the @instrumented wrapper, to the caller
+        if intersection:
+            covered = ~np.isnan(intensities).any(axis=1)
+            if not covered.any():
+                raise ValueError("The wave number ranges of the files do not overlap")
+            wavenumber, intensities = wavenumber[covered], np.asfortranarray(intensities[covered])
+
+    return wavenumber, intensities
+
+@instrumented
+def load_series(csv_dir=None, workers=None, extension=".csv", dtype=None, grid=None):
+    """
+    Read every `extension` file (.csv or .spa) in `csv_dir` into one intensity matrix.
 
-    combined_raw_df = pd.DataFrame()
-    referenced_raw_df = pd.DataFrame()
+    Files are parsed concurrently in a thread pool and each one is written
+    straight into its column of a preallocated array.
 
-    for idx, file in enumerate(csv_files):
-        file_path = os.path.join(csv_dir, file)
-        df = pd.read_csv(file_path, header=None)
+    Parameters
+    ----------
+    csv_dir : str | None
+        Folder holding the spectra. Defaults to ./raw
+    workers : int | None
+        Number of reader threads. Defaults to min(8, cpu count).
+    extension : str
+        ".csv" for Omnic CSV exports, ".spa" for the native binary files.
+    dtype : np.dtype | None
+        dtype of the intensities, defaults to DTYPE.
+    grid : np.ndarray | "intersection" | None
+        Common wave number axis, see read_series_files. Defaults to the
+        axis of the first file.
+
+    Returns
+    -------
+    wavenumber : np.ndarray, shape (n_points,)
+    names : list[str]
+        Column names (file names without extension), in sorted order.
+    intensities : np.ndarray, shape (n_points, n_spectra)
+    """
+    if csv_dir is None:
+        csv_dir = os.path.join(os.getcwd(), "raw")
+
+    csv_files = list_series_files(csv_dir, extension)
+    if not csv_files:
+        raise FileNotFoundError(f"No {extension} files found in {csv_dir}")
+    names = [_column_name(file) for file in csv_files]
+    paths = [os.path.join(csv_dir, file) for file in csv_files]
+
+    wavenumber, intensities = read_series_files(paths, workers=workers, grid=grid, dtype=dtype)
+    return wavenumber, names, intensities
+
+@instrumented
+def series_to_dataframe(wavenumber, names, intensities):
+    # Build the whole frame at once instead of inserting column by column,
+    # around the matrix itself (pandas copies on write, so it stays intact)
+    df = pd.DataFrame(intensities, columns=names, copy=False)
+    df.insert(0, 'Wave number', wavenumber)
+    return df
+
+@instrumented
+def combining_series(csv_dir=None, workers=None, output="both", incremental=False,
+                     extension=".csv", dtype=None, grid=None):
+    """
+    Combine all spectra in `csv_dir` and reference them to the first one.
+
+    `output` chooses what is written: "csv" (combined_raw.csv and
+    referenced_raw.csv), "store" (combined_raw_store/ and referenced_raw_store/,
+    see series_store.py) or "both".
+
+    With `incremental=True` a manifest of the ingested files (size, mtime and
+    sha1) is kept in combined_manifest.json. Later calls only parse files that
+    are new or changed and append them to the stores, which makes repeated
+    calls during a running series cheap. The stores are always kept in this
+    mode because they hold the already ingested spectra; CSVs are rewritten
+    from them when requested. A changed reference (first file) rebuilds all.
+
+    `extension=".spa"` reads the native Omnic files instead of the CSV exports.
+
+    `dtype` is the dtype of the intensities in the frames and the stores,
+    DTYPE by default; np.float32 halves the memory. Incremental calls with
+    another dtype than the stores rebuild them.
+
+    `grid` is the common wave number axis (see read_series_files), the axis
+    of the first file by default. "intersection" keeps only the points every
+    file covers; files on a narrower axis are NaN at the edges otherwise.
+    Incremental calls rebuild the stores when an explicit grid differs from
+    the stored axis, or with "intersection" when a new file is narrower.
+    """
+    if output not in ("csv", "store", "both"):
+        raise ValueError(f"output must be 'csv', 'store' or 'both', not {output!r}")
+
+    # Set the directory containing your CSV files (default ./raw)
+    if csv_dir is None:
+        csv_dir = os.path.join(os.getcwd(), "raw")
+
+    if incremental:
+        combined, referenced = _update_stores(csv_dir, workers, extension, _dtype(dtype), grid)
+        combined_raw_df = combined.to_dataframe()
+        referenced_raw_df = referenced.to_dataframe()
+        if output in ("csv", "both"):
+            combined_raw_df.to_csv('combined_raw.csv', index=False)
+            referenced_raw_df.to_csv('referenced_raw.csv', index=False)
+        return combined_raw_df, referenced_raw_df
+
+    wavenumber, names, intensities = load_series(csv_dir, workers=workers, extension=extension, dtype=dtype,
+                                                 grid=grid)
+
+    # Use the first file as the reference for substracting others,
+    # one broadcast over the whole matrix
+    referenced = intensities - intensities[:, [0]]
+
+    if output in ("store", "both"):
+        metadata = _series_metadata(csv_dir, names, extension)
+        write_store(COMBINED_STORE, wavenumber, names, intensities, metadata, dtype=intensities.dtype)
+        write_store(REFERENCED_STORE, wavenumber, names, referenced, metadata, dtype=referenced.dtype)
+
+    combined_raw_df = series_to_dataframe(wavenumber, names, intensities)
+    referenced_raw_df = series_to_dataframe(wavenumber, names, referenced)
+
+    if output in ("csv", "both"):
+        # Write combined dataframe to a new CSV
+        combined_raw_df.to_csv('combined_raw.csv', index=False)
+        referenced_raw_df.to_csv('referenced_raw.csv', index=False)
+
+    return combined_raw_df, referenced_raw_df
+
+@instrumented
+def load_combined(path=COMBINED_STORE, wave_range=None, cols=None, dtype=None):
+    """
+    Load part of a store into memory as a DataFrame.
 
-        # For the first file, take both columns: wave number and intensity
-        if idx == 0:
-            wavenumber = df.iloc[:, 0]
-            reference = df.iloc[:, 1]
-            combined_raw_df['Wave number'] = wavenumber
-            #combined_bkg_subtracted_df['wave number'] = wavenumber
-            referenced_raw_df['Wave number'] = wavenumber
-            #referenced_bkg_subtracted_df['wave number'] = wavenumber
+    Only the rows of `wave_range` (exclusive bounds) and the spectra `cols`
+    (names, or positions with 0 the first spectrum) are read from the memory
+    map and copied, in `dtype` (defaults to the dtype of the store). Use it
+    to keep a window of a month-long run in RAM without the rest.
+    """
+    store = open_store(path)
+    selector = WindowSelector(store)
+    x, Y = selector.select(wave_range, cols)
+    return series_to_dataframe(np.array(x, dtype=np.float64),
+                               selector.names(cols),
+                               np.array(Y, dtype=store.dtype if dtype is None else _dtype(dtype), order="F"))
+
+def _series_metadata(csv_dir, names, extension=".csv"):
+    paths = [os.path.join(csv_dir, name + extension) for name in names]
+    metadata = {
+        "source": os.path.abspath(csv_dir),
+        "reference": names[0],
+        # Omnic does not write the collection time to the CSV, the file
+        # modification time is the closest we have
+        "mtime": [os.path.getmtime(path) for path in paths],
+    }
+    if extension == ".spa":
+        metadata["timestamp"] = [_isoformat(read_spa_timestamp(path)) for path in paths]
+    return metadata
+
+def _isoformat(timestamp):
+    return timestamp.isoformat() if timestamp is not None else None
+
+def _file_entry(path, with_hash=True):
+    stat = os.stat(path)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if with_hash:
+        with open(path, "rb") as f:
+            entry["sha1"] = hashlib.sha1(f.read()).hexdigest()
+    return entry
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _save_manifest(manifest):
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def _rebuild_stores(csv_dir, workers, extension, dtype, grid=None):
+    # Hash before parsing: a file still being written shows up as changed next time
+    csv_files = list_series_files(csv_dir, extension)
+    files = {file: _file_entry(os.path.join(csv_dir, file)) for file in csv_files}
+    combining_series(csv_dir, workers=workers, output="store", extension=extension, dtype=dtype, grid=grid)
+    _save_manifest({"source": os.path.abspath(csv_dir), "files": files})
+    return open_store(COMBINED_STORE), open_store(REFERENCED_STORE)
+
+def _update_stores(csv_dir, workers, extension, dtype, grid=None):
+    manifest = _load_manifest()
+    csv_files = list_series_files(csv_dir, extension)
+    if not csv_files:
+        raise FileNotFoundError(f"No {extension} files found in {csv_dir}")
+    if (manifest is None or manifest.get("source") != os.path.abspath(csv_dir)
+            or not os.path.isdir(COMBINED_STORE) or not os.path.isdir(REFERENCED_STORE)):
+        return _rebuild_stores(csv_dir, workers, extension, dtype, grid)
+
+    known = manifest["files"]
+    combined = open_store(COMBINED_STORE)
+    # Files must still be there and keep their place in the sorted order,
+    # new ones can only be appended after them
+    if ([_column_name(file) for file in known] != combined.columns
+            or csv_files[:len(known)] != list(known) or combined.dtype != dtype
+            or (grid is not None and not isinstance(grid, str)
+                and axis_key(grid) != axis_key(combined.wavenumber))):
+        return _rebuild_stores(csv_dir, workers, extension, dtype, grid)
+
+    changed = []
+    for file in known:
+        path = os.path.join(csv_dir, file)
+        entry = _file_entry(path, with_hash=False)
+        if entry["size"] == known[file]["size"] and entry["mtime"] == known[file]["mtime"]:
+            continue
+        # stat changed, only the content hash tells whether it really did
+        entry = _file_entry(path)
+        if entry["sha1"] != known[file]["sha1"]:
+            if file == csv_files[0]:
+                # every referenced column depends on the reference
+                return _rebuild_stores(csv_dir, workers, extension, dtype, grid)
+            changed.append(file)
+        known[file] = entry
+    new_files = csv_files[len(known):]
+
+    if changed:
+        paths = [os.path.join(csv_dir, file) for file in changed]
+        wavenumber, intensities = read_series_files(paths, workers=workers, grid=combined.wavenumber, dtype=dtype)
+        if isinstance(grid, str) and np.isnan(intensities).any():
+            # narrower than the stored axis, which has to shrink
+            return _rebuild_stores(csv_dir, workers, extension, dtype, grid)
+        combined = open_store(COMBINED_STORE, mode="r+")
+        referenced = open_store(REFERENCED_STORE, mode="r+")
+        for idx, file in enumerate(changed):
+            col = combined.columns.index(_column_name(file))
+            combined.intensities[:, col] = intensities[:, idx]
+            referenced.intensities[:, col] = intensities[:, idx] - combined.intensities[:, 0]
+        combined.data.flush()
+        referenced.data.flush()
+
+    if new_files:
+        paths = [os.path.join(csv_dir, file) for file in new_files]
+        entries = [_file_entry(path) for path in paths]
+        wavenumber, intensities = read_series_files(paths, workers=workers, grid=combined.wavenumber, dtype=dtype)
+        if isinstance(grid, str) and np.isnan(intensities).any():
+            return _rebuild_stores(csv_dir, workers, extension, dtype, grid)
+        combined = open_store(COMBINED_STORE)
+        referenced_new = intensities - np.asarray(combined.intensities[:, [0]])
+        names = [_column_name(file) for file in new_files]
+        # per-spectrum lists (mtime, timestamp) extend the stored ones
+        metadata = {key: value for key, value in _series_metadata(csv_dir, names, extension).items()
+                    if isinstance(value, list)}
+        append_to_store(COMBINED_STORE, names, intensities, metadata)
+        append_to_store(REFERENCED_STORE, names, referenced_new, metadata)
+        known.update(zip(new_files, entries))
+
+    _save_manifest(manifest)
+    return open_store(COMBINED_STORE), open_store(REFERENCED_STORE)
+
+def _as_dataframe(df):
+    # Accept a SeriesStore wherever a DataFrame is expected; the frame wraps
+    # the memory map so no text is parsed and nothing is copied
+    if isinstance(df, SeriesStore):
+        return df.to_dataframe()
+    return df
+
+
+def _baseline_cache(cache):
+    # cache=True uses a BaselineCache in ./.baseline_cache shared by all calls
+    global _default_cache
+    if cache is True:
+        from baseline_cache import DEFAULT_CACHE_DIR, BaselineCache
+        if _default_cache is None or _default_cache.path != os.path.abspath(DEFAULT_CACHE_DIR):
+            _default_cache = BaselineCache(os.path.abspath(DEFAULT_CACHE_DIR))
+        return _default_cache
+    return cache or None
+
+_default_cache = None
+
+@instrumented(fitter=lambda arguments: arguments["fitter"])
+def bkg_fitting(fitter,x,y,cache=None,**params):
+    # Parameters default to FITTER_PARAMS[fitter] (baselines.py), keyword
+    # arguments override them
+    from pybaselines import Baseline
+    from baselines import fitter_params
+
+    params = fitter_params(fitter, **params)
+    cache = _baseline_cache(cache)
+    if cache is not None:
+        key = cache.key(fitter, params, x, y, kind="fit")
+        entry = cache.get(key)
+        if entry is not None:
+            fit_params = {name[len("param_"):]: value if value.ndim else value.item()
+                          for name, value in entry.items() if name.startswith("param_")}
+            return entry["baseline"], fit_params
 
-        combined_raw_df[file.replace('.csv', '')] = df.iloc[:, 1]
+    baseline_fitter = Baseline(x_data=x)
+    bkg, fit_params = getattr(baseline_fitter, fitter)(y, **params)
+    if cache is not None:
+        cache.put(key, baseline=bkg, **{"param_" + name: value for name, value in fit_params.items()})
+    return bkg, fit_params
 
-        # Use the first file as the reference for substracting others
-        referenced_raw_df[file.replace('.csv', '')] = df.iloc[:, 1] - reference
+@instrumented(fitter=lambda arguments: arguments["fitter"])
+def bkg_subtraction(df,fitter,return_info=False,workers=None,cache=None,warm_start=False,**params):
+    """
+    Baseline-subtract every y column of `df` (first column is x).
 
-    # Write combined dataframe to a new CSV
-    combined_raw_df.to_csv('combined_raw.csv', index=False)
-    referenced_raw_df.to_csv('referenced_raw.csv', index=False)
+    All columns share the x axis, so the fitter is set up once and applied to
+    the whole intensity matrix (see baselines.BatchBaseline). With
+    `return_info=True` the per-column convergence table (iterations, tol,
+    converged) is returned as well.
 
+    `workers` > 1 fits column chunks in that many processes
+    (baselines.fit_baselines_parallel); the result is identical to the
+    serial one.
 
-def bkg_fitting(fitter,x,y):
-    baseline_fitter = Baseline(x_data=x)
+    `cache=True` (or a BaselineCache) looks every column up in the on-disk
+    baseline cache first and only fits the ones that are not there.
 
-    if fitter == "modpoly":
-        bkg, params = baseline_fitter.modpoly(y, poly_order=5)
-    elif fitter == "asls":
-        bkg, params = baseline_fitter.asls(y, lam=1e7, p=0.02)
-    elif fitter == "mor":
-        bkg, params = baseline_fitter.mor(y, half_window=30)
-    elif fitter == "snip":
-        bkg, params = baseline_fitter.snip(y, max_half_window=40, decreasing=True, smooth_half_window=3)
-    return bkg, params
+    `warm_start=True` fits the columns in order, each one starting from the
+    previous result (see BatchBaseline.fit). Meant for time series; it cannot
+    be combined with the cache or with `workers` > 1 because a result then
+    depends on the column before it.
 
-def bkg_subtraction(df,fitter):
+    Spectra with NaN or inf (e.g. interpolated onto a wider axis, see
+    combining_series) raise ValueError instead of giving NaN baselines.
 
-    df_bkg_subtracted = pd.DataFrame()
-    x = df.iloc[:,0]
-    df_bkg_subtracted['Wave number'] = x
+    float32 intensities (compact mode) are fitted column by column in
+    float64 and the result is float32 again.
+    """
+    from baselines import BatchBaseline, check_finite, fit_baselines_parallel, fitter_params, float_dtype
+
+    df = _as_dataframe(df)
+
+    x = df.iloc[:,0].to_numpy(dtype=np.float64)
+    Y = df.iloc[:, 1:].to_numpy()
+    Y = Y.astype(float_dtype(Y.dtype), copy=False)
+    # with the names of the spectra, the fitters only know positions
+    check_finite(Y, df.columns[1:])
+
+    def fit(Y):
+        if workers is not None and workers > 1:
+            return fit_baselines_parallel(fitter, x, Y, workers=workers, **params)
+        return BatchBaseline(x, fitter, **params).fit(Y, warm_start=warm_start)
+
+    cache = _baseline_cache(cache)
+    if cache is not None and warm_start:
+        raise ValueError("warm_start cannot be combined with the baseline cache")
+    if workers is not None and workers > 1 and warm_start:
+        raise ValueError("warm_start fits the columns in order, it cannot be combined with workers > 1")
+    if cache is not None:
+        bkg, info = cache.fit_columns(fitter, fitter_params(fitter, **params), x, Y, fit)
+        corrected = Y - bkg
+    else:
+        bkg, corrected, info = fit(Y)
 
-    for col in df.columns[1:]:
-        y = df[col]
-        bkg, params = bkg_fitting(fitter,x,y) # fit data with selected fitter
-        df_bkg_subtracted[col] = y - bkg
+    df_bkg_subtracted = pd.DataFrame(corrected, index=df.index, columns=df.columns[1:], copy=False)
+    df_bkg_subtracted.insert(0, 'Wave number', x)
     #df_bkg_subtracted.to_csv(f"selected_bkg_subtracted.csv", index=False)
+    if return_info:
+        info.index = df.columns[1:]
+        return df_bkg_subtracted, info
     return df_bkg_subtracted
 
-def columns_selection(df,wave_range,cols):
-    # Select specific columns to perform the baseline correction
-
-    #select proper range of wave number
-    if wave_range is not None:
-        df_wave_selected = df[(df["Wave number"] > wave_range[0]) & (df["Wave number"] < wave_range[1]) ]
-    else:
-        df_wave_selected = df
-
-    df_selected = pd.DataFrame()
-    x = df_wave_selected.iloc[:,0]
-    df_selected['Wave number'] = x
-
-    for col in cols:
-        if isinstance(col, int):
-            if col < 0 or col >= df.shape[1]:
-                raise IndexError(f"Column index {col} is out of range.")
-            df_selected[df_wave_selected.columns[col]] = df_wave_selected.iloc[:, col]
-
-        else:
-            if col not in df.columns:
-                raise KeyError(f"Column '{col}' not found in DataFrame.")
-            df_selected[col] = df_wave_selected[col]
-
-    df_selected.to_csv(f"selected_{wave_range}.csv", index=False)
+@instrumented
+def columns_selection(df,wave_range,cols=None,export=False,copy=True):
+    # Select specific columns to perform the baseline correction.
+    # The window is found with searchsorted (see windowing.py) and copied;
+    # copy=False returns views of df instead, which an edit writes through
+    # to before pandas 3. export=True writes selected_{wave_range}.csv,
+    # a string writes to that path
+    selector = WindowSelector(df if isinstance(df, SeriesStore) else _as_dataframe(df))
+
+    names = None
+    if cols is not None:
+        names = []
+        for col in cols:
+            # integer columns count 'Wave number' as column 0, like df.iloc
+            if isinstance(col, (int, np.integer)) and not isinstance(col, bool):
+                if col < 0 or col > len(selector.columns):
+                    raise IndexError(f"Column index {col} is out of range.")
+                if col > 0:
+                    names.append(selector.columns[col - 1])
+            elif col != 'Wave number':
+                names.append(col)
+        names = list(dict.fromkeys(names))
+
+    df_selected = selector.frame(wave_range, names, copy=copy)
+
+    if export:
+        df_selected.to_csv(export if isinstance(export, str) else f"selected_{wave_range}.csv", index=False)
 
     return df_selected
 
-def plot_columns(df, xlim=None, ylim=None, reverse_x=True):
+@instrumented
+def plot_columns(df, xlim=None, ylim=None, reverse_x=True, fast=False, interval=10):
     """
     Plot selected columns of a DataFrame against the first column.
 
+    With fast=True all columns are drawn as one LineCollection coloured by
+    time, decimated to the screen resolution, on a headless Agg canvas
+    (fast_plot.render_columns); the figure is saved but not shown.
+
     Parameters
     ----------
     df : pd.DataFrame
@@ -110,12 +550,27 @@ def plot_columns(df, xlim=None, ylim=None, reverse_x=True):
         (xmin, xmax) range. Defaults to full range of x.
     reverse_x : bool
         If True, reverse the x-axis direction.
+    fast : bool
+        Use the fast rendering described above.
+    interval : float
+        Minutes between spectra, for the labels and the colour bar.
 
      Returns
     -------
     matplotlib.axes.Axes
         The Axes object of the plot.
     """
+    if fast:
+        from fast_plot import render_columns
+
+        selector = WindowSelector(df if isinstance(df, SeriesStore) else _as_dataframe(df))
+        return render_columns(selector.x, selector.intensities, selector.columns, xlim=xlim, ylim=ylim,
+                              reverse_x=reverse_x, interval=interval, path=f"spectrum_{xlim}.png")
+
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import AutoMinorLocator
+
+    df = _as_dataframe(df)
 
     x = df.iloc[:, 0]
     x_label = "Wavenumber (cm$^{-1}$)" #df.columns[0]
@@ -125,7 +580,7 @@ def plot_columns(df, xlim=None, ylim=None, reverse_x=True):
     # Plot each requested column
     for col in df.columns[1:]:
         y = df[col]
-        label = "%d min" %(int(col)*10) # 10 min interval
+        label = "%d min" %(int(col)*interval)
         ax.plot(x, y, label=label)
 
     # Labels & legend
@@ -143,11 +598,15 @@ def plot_columns(df, xlim=None, ylim=None, reverse_x=True):
     else:
         ax.set_xlim(float(x.min()), float(x.max()))
 
-    # y range (default to full)
+    # y range (default to all the series inside the x range)
     if ylim is not None:
         ax.set_ylim(ylim)
-    else:
-        ax.set_ylim(float(y.min()), float(y.max()))
+    elif df.shape[1] > 1:
+        visible = df.iloc[:, 1:].to_numpy()
+        if xlim is not None:
+            visible = visible[(x >= min(xlim)).to_numpy() & (x <= max(xlim)).to_numpy()]
+        if visible.size:
+            ax.set_ylim(float(np.nanmin(visible)), float(np.nanmax(visible)))
 
     # Reverse x direction if requested
     if reverse_x:
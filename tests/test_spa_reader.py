@@ -0,0 +1,49 @@
+"""
+read_spa against real Omnic files.
+
+Every tests/data/<name>.spa needs the CSV Omnic exported from the same
+spectrum next to it (<name>.csv, File > Save As > CSV). The files
+write_spa makes only follow the layout read_spa expects, so they cannot
+check the signature, the directory walk or the entry count against what
+Omnic really writes; without a real pair the tests are skipped.
+"""
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from spa_reader import read_spa, read_spa_timestamp
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SAMPLES = sorted(path for path in glob.glob(os.path.join(DATA_DIR, "*.spa"))
+                 if os.path.exists(os.path.splitext(path)[0] + ".csv"))
+
+pytestmark = pytest.mark.skipif(not SAMPLES, reason="no Omnic .spa file with its CSV export in tests/data")
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_matches_csv_export(path):
+    exported = np.loadtxt(os.path.splitext(path)[0] + ".csv", delimiter=",")
+    wavenumber, intensities, metadata = read_spa(path)
+
+    assert wavenumber.shape == intensities.shape == (exported.shape[0],)
+    # the CSV is written with a few decimals, the .spa holds float32
+    spacing = abs(wavenumber[1] - wavenumber[0])
+    np.testing.assert_allclose(wavenumber, exported[:, 0], rtol=0, atol=0.01 * spacing)
+    np.testing.assert_allclose(intensities, exported[:, 1], rtol=1e-4,
+                               atol=1e-5 * np.abs(exported[:, 1]).max())
+    assert metadata["x_units"] == "cm-1"
+    assert metadata["timestamp"] is not None
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_timestamp_matches_full_read(path):
+    assert read_spa_timestamp(path) == read_spa(path)[2]["timestamp"]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "export.spa"
+    path.write_bytes(open(SAMPLES[0].replace(".spa", ".csv"), "rb").read())
+    with pytest.raises(ValueError, match="not a .spa file"):
+        read_spa(str(path))
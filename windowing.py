@@ -0,0 +1,158 @@
+"""
+Wave number windows without masks or copies.
+
+`WindowSelector` looks at the wave number axis once. Omnic writes it sorted
+(decreasing), so a window is found with two `searchsorted` calls on the
+axis and returned as a slice of rows: the x and intensity arrays handed back
+are views of the original data, however many windows are scanned.
+
+    selector = WindowSelector(referenced)            # DataFrame, store or (x, Y)
+    for wave_range in windows:
+        x, Y = selector.select(wave_range)           # views, O(log n)
+    df = selector.frame((1000, 1800), cols=["0003", "0010"])   # a copy
+    selector.export((1000, 1800), "selected.csv")    # only when asked
+
+The bounds are exclusive, like `columns_selection`. An axis that is not
+sorted is argsorted once; windows are then gathered with an index array,
+which copies.
+"""
+import numpy as np
+import pandas as pd
+
+from series_store import SeriesStore
+
+
+def column_times(names, interval=10):
+    # "0003" -> 30 min, like the labels of plot_columns; position otherwise
+    try:
+        return np.array([int(name) for name in names], dtype=float) * interval
+    except (TypeError, ValueError):
+        return np.arange(len(names), dtype=float) * interval
+
+
+class WindowSelector:
+    """
+    Parameters
+    ----------
+    data : pd.DataFrame | SeriesStore | tuple[np.ndarray, np.ndarray]
+        A frame whose first column is the wave number, a series store, or
+        (x, Y) with Y of shape (n_points, n_spectra).
+
+    Attributes
+    ----------
+    x : np.ndarray
+        The wave number axis, in its original order.
+    intensities : np.ndarray
+        The spectra, one per column.
+    columns : list[str]
+        Spectrum names.
+    """
+
+    def __init__(self, data):
+        self.index = None
+        if isinstance(data, SeriesStore):
+            self.x, self.intensities, self.columns = data.wavenumber, data.intensities, list(data.columns)
+        elif isinstance(data, pd.DataFrame):
+            self.x = data.iloc[:, 0].to_numpy()
+            self.intensities = data.iloc[:, 1:].to_numpy()
+            self.columns = list(data.columns[1:])
+            self.index = data.index
+        else:
+            x, intensities = data
+            self.x, self.intensities = np.asarray(x), np.asarray(intensities)
+            self.columns = [str(col) for col in range(self.intensities.shape[1])]
+        if self.intensities.ndim == 1:
+            self.intensities = self.intensities[:, None]
+        self._positions = {name: pos for pos, name in enumerate(self.columns)}
+
+        # Index the axis once: a reversed view when it decreases, an argsort
+        # when it is not sorted at all
+        steps = np.diff(self.x)
+        self._order = None
+        if np.all(steps >= 0):
+            self._ascending, self._descending = self.x, False
+        elif np.all(steps <= 0):
+            self._ascending, self._descending = self.x[::-1], True
+        else:
+            self._order = np.argsort(self.x, kind="stable")
+            self._ascending, self._descending = self.x[self._order], False
+
+    def __len__(self):
+        return self.x.size
+
+    def rows(self, wave_range):
+        """Rows with wave_range[0] < x < wave_range[1]: a slice, or an index array for an unsorted axis."""
+        if wave_range is None:
+            return slice(0, self.x.size)
+        low = np.searchsorted(self._ascending, wave_range[0], side="right")
+        high = max(np.searchsorted(self._ascending, wave_range[1], side="left"), low)
+        if self._order is not None:
+            return np.sort(self._order[low:high])
+        if self._descending:
+            return slice(self.x.size - high, self.x.size - low)
+        return slice(low, high)
+
+    def _column_positions(self, cols):
+        # a slice when possible (a view), else a list of positions (a copy)
+        if cols is None:
+            return slice(None)
+        if isinstance(cols, slice):
+            return cols
+        positions = []
+        for col in cols:
+            if isinstance(col, (int, np.integer)) and not isinstance(col, bool):
+                if col < 0 or col >= len(self.columns):
+                    raise IndexError(f"Column index {col} is out of range.")
+                positions.append(int(col))
+            else:
+                if col not in self._positions:
+                    raise KeyError(f"Column '{col}' not found in DataFrame.")
+                positions.append(self._positions[col])
+        if len(positions) <= 1:
+            return slice(positions[0], positions[0] + 1) if positions else positions
+        steps = np.diff(positions)
+        if steps[0] > 0 and np.all(steps == steps[0]):
+            return slice(positions[0], positions[-1] + 1, int(steps[0]))
+        return positions
+
+    def select(self, wave_range=None, cols=None):
+        """
+        (x, Y) of a window and a subset of spectra.
+
+        `cols` are spectrum names or positions (0 is the first spectrum), or a
+        slice; evenly spaced columns come back as a view, others are copied.
+        """
+        rows = self.rows(wave_range)
+        columns = self._column_positions(cols)
+        if isinstance(rows, slice) and isinstance(columns, slice):
+            return self.x[rows], self.intensities[rows, columns]
+        return self.x[rows], self.intensities[rows][:, columns]
+
+    def names(self, cols=None):
+        columns = self._column_positions(cols)
+        if isinstance(columns, slice):
+            return self.columns[columns]
+        return [self.columns[pos] for pos in columns]
+
+    def frame(self, wave_range=None, cols=None, copy=True):
+        """
+        The window as a DataFrame ('Wave number' first).
+
+        The frame owns its data by default, so it can be edited whatever the
+        pandas version or the source (a read-only store). copy=False wraps
+        the views of `select` instead: before pandas 3 an edit of that frame
+        writes through to the source.
+        """
+        rows = self.rows(wave_range)
+        x, Y = self.select(wave_range, cols)
+        df = pd.DataFrame(Y, columns=self.names(cols), copy=copy,
+                          index=None if self.index is None else self.index[rows])
+        df.insert(0, "Wave number", pd.Series(x, index=df.index, copy=copy))
+        return df
+
+    def export(self, wave_range=None, path=None, cols=None):
+        """Write the window to CSV, by default selected_{wave_range}.csv. Returns the path."""
+        if path is None:
+            path = f"selected_{wave_range}.csv"
+        self.frame(wave_range, cols, copy=False).to_csv(path, index=False)
+        return path